@@ -1,5 +1,4 @@
 from test import RandomTestSetBase
-import random
 
 def get_config():
     return {"timeout": 1}
@@ -9,8 +8,8 @@ class RandomTestSet(RandomTestSetBase):
         super().__init__(labID, problemID, case_num)
     
     def generate(self):
-        a = random.randint(0, 60)
-        b = random.randint(0, 60)
+        a = self.rng.randint(0, 60)
+        b = self.rng.randint(0, 60)
         tc_name = "rand" + str(self.cnt)
         tc_input = f"{a} {b}"
         tc_output = f"{a+b}"
@@ -1,4 +1,4 @@
-from test import StrReader
+from test import StrReader, name_ids, np, rank_table
 
 
 def get_config():
@@ -8,39 +8,39 @@ def get_config():
 def verifier(input, output) -> bool:
     sr = StrReader(input)
     N = int(sr.read())
-    boy_name = []
-    girl_name = []
-    boy_pref = {}
-    girl_pref = {}
-    for _ in range(N):
-        boy_name.append(sr.read())
-    for _ in range(N):
-        girl_name.append(sr.read())
-    for boy in boy_name:
-        pref = []
-        for _ in range(N):
-            pref.append(sr.read())
-        boy_pref[boy] = pref
-    for girl in girl_name:
-        pref = []
-        for _ in range(N):
-            pref.append(sr.read())
-        girl_pref[girl] = pref
+    boy_id = name_ids(sr.read_tokens(N))
+    girl_id = name_ids(sr.read_tokens(N))
+    boy_pref = [[girl_id[g] for g in sr.read_tokens(N)] for _ in range(N)]
+    girl_pref = [[boy_id[b] for b in sr.read_tokens(N)] for _ in range(N)]
+    boy_rank = rank_table(boy_pref)
+    girl_rank = rank_table(girl_pref)
 
+    # the output must be a perfect matching
     sr = StrReader(output)
-    bg = {}
-    gb = {}
-    for _ in range(N):
-        boy = sr.read()
-        girl = sr.read()
-        bg[boy] = girl
-        gb[girl] = boy
+    try:
+        pairs = sr.read_tokens(2 * N)
+    except BufferError:
+        return False
+    if not sr.at_end():
+        return False
+    wife = [-1] * N
+    husband = [-1] * N
+    for boy, girl in zip(pairs[::2], pairs[1::2]):
+        b = boy_id.get(boy)
+        g = girl_id.get(girl)
+        if b is None or g is None or wife[b] != -1 or husband[g] != -1:
+            return False
+        wife[b] = g
+        husband[g] = b
 
-    for boy in boy_name:
-        for girl in girl_name:
-            if boy_pref[boy].index(girl) < boy_pref[boy].index(bg[boy]) and girl_pref[
-                girl
-            ].index(boy) < girl_pref[girl].index(gb[girl]):
+    # and have no pair preferring each other to whom they are matched with
+    if np is not None:
+        idx = np.arange(N)
+        boy_better = boy_rank < boy_rank[idx, wife][:, None]
+        girl_better = girl_rank < girl_rank[idx, husband][:, None]
+        return not np.any(boy_better & girl_better.T)
+    for b in range(N):
+        for g in boy_pref[b][: boy_rank[b][wife[b]]]:
+            if girl_rank[g][b] < girl_rank[g][husband[g]]:
                 return False
-
     return True
@@ -1,7 +1,46 @@
 from os import name
 import time
 import importlib
-from collections import defaultdict
+import importlib.util
+import hashlib
+import heapq
+import contextlib
+import ctypes
+import ctypes.util
+import cProfile
+import io
+import itertools
+import json
+import re
+import select
+import shutil
+import socket
+import sqlite3
+import struct
+import functools
+import math
+import signal
+import tempfile
+import threading
+import zlib
+import xml.etree.ElementTree as ET
+from array import array
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import multiprocessing
+import os
+import pstats
+import queue
+import random
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+try:
+    import numpy as np
+except ImportError:  # optional, only used to speed up checkers
+    np = None
 from pathlib import Path
 import sys
 import argparse
@@ -14,14 +53,64 @@ the testcase in `<LABID>/test/<PROBID>/<testcaseID>`.
 In the `test` directory of every problem, a file `spec.*` is required to specify
 basic settings and optional problem-specific random testcase generator for the
 problem where `*` means `.py` or `.out`. When both `.py` and `.out` exist,
-`.out` is prefered in consideration of efficiency. (However, the support for
-`spec.out` has not been implemented yet. TODO: support for `spec.out`)
+`.out` is prefered in consideration of efficiency.
+
+`spec.out` is an executable speaking the following protocol:
+    `spec.out config` prints the config object as lines of `KEY VALUE`.
+    `spec.out generate SEED FIRST NUM [SIZE]` streams the random testcases
+        with indices FIRST, ..., FIRST+NUM-1 which must only depend on SEED,
+        the index and SIZE, the size of the cases if given. Each case is a
+        header line `NAME IN_BYTES OUT_BYTES` followed by IN_BYTES bytes of
+        input and OUT_BYTES bytes of expected output. OUT_BYTES is -1 if the
+        output has to be checked instead.
+    `spec.out check INPUT OUTPUT` reads the input and the output of a case
+        from the files INPUT and OUTPUT and exits with 0 if the output is
+        accepted, or 1 otherwise.
 
 In `spec.py`, a function `get_config` that returns a config object is required.
 The config object must contain a key "timeout" which indicates the time limit
-in the unit of seconds, the value being a number. Additionally, if randomly
-generated testcases are wanted, `spec.py` ought to have a class `RandomTestSet`
-inheriting from class `RandomTestSetBase` in the `test.py`
+in the unit of seconds, the value being a number. The limit applies to the CPU
+time (user + sys) of your executable, which is also the reported time. An
+optional key "memory" limits its address space in the unit of MB, exceeding
+which is reported as `MEMORY_LIMIT_EXCEEDED`. The output is compared with the
+expected one while your executable is running, which is killed on the first
+difference or once it prints more than "output_limit" MB (256 by default).
+The optional key "compare" relaxes the comparison: "exact", "strip" (the
+default, ignoring leading and trailing whitespace), "lines" (also ignoring
+trailing whitespace of every line) or "tokens" (only comparing whitespace
+separated tokens).
+
+Every testcase runs in a process group of its own, which is killed as a whole
+once EXEC exits, so that forked processes never outlive it. The optional key
+"processes" is the number of processes EXEC may create, 0 forbidding fork(2).
+Files written by EXEC are limited to "output_limit" as well. Where a cgroup
+v2 can be created, every testcase runs in a cgroup of its own, which also
+catches processes leaving the group and accounts their CPU time to EXEC, and
+enforces "memory" and "processes" when these controllers are delegated.
+Otherwise "processes" is only approximated by RLIMIT_NPROC, which counts all
+the processes and threads of the user: it is set to the number of them
+running when EXEC starts plus "processes". Those created meanwhile by
+anything else count against EXEC, while EXEC may create a few more before the
+threads serving it are up, and root is not limited at all.
+`--no-cgroup` saves the few milliseconds it costs per testcase.
+
+If EXEC accepts many testcases in a single run, spawning a process for every
+tiny testcase can be avoided by an optional key "batch" whose value is a dict:
+    "size": the number of testcases run at once, 1000 by default
+    "header": "count" to put the number of testcases on the first line of
+        the input, otherwise the inputs are simply concatenated
+    "delimiter": a line EXEC prints after the output of every testcase, or
+    "lines": the number of lines of the output of every testcase, 1 by
+        default, if there is no delimiter
+    "timeout": the time limit of a batch, "timeout" times "size" by default
+The reported time of a testcase is its share of the CPU time of the batch.
+
+If randomly generated testcases are wanted, `spec.py` ought to have a class
+`RandomTestSet` inheriting from class `RandomTestSetBase` in the `test.py`. Its
+`generate` may honor the attribute `size` when it is not None, which is used
+by `bench`. Verifiers may parse with `StrReader`, and `rank_table` turns
+preference lists of integer ids (see `name_ids`) into O(1) rank lookups,
+backed by NumPy if it is installed.
 
 To change the default setting, the following options can be used.
 
@@ -35,52 +124,157 @@ To change the default setting, the following options can be used.
 
    *`-m SID` helps to match your result with that of other students with SID as
     his or her studentID. Either full studentID or the last few digits, if no
-    ambiguity (usually last 4 is enough), is acceptable.
+    ambiguity (usually last 4 is enough), is acceptable. Outputs of the other
+    executable are cached in `.cache/reference`, bounded by `--cache-size MB`,
+    so that repeated matching only runs your executable. The other executable
+    runs alongside yours on the same input and is limited by the optional
+    "ref_timeout" in the config (7 seconds by default).
 
    *`-l` helps to list all the available executables you can match with.
+
+   *`--stress` together with `-m SID` keeps matching on random testcases, in
+    parallel with `-j NUM` and up to `-r NUM` cases if given, until your
+    executable disagrees with the other one. The input is then shrunk to a
+    minimal counterexample by a `shrink(input)` function of `spec.py`, which
+    yields smaller inputs, if any, and by deleting lines and tokens and
+    reducing integers. Throughput is reported in cases per second.
+
+   *`--changed-only` skips testcases whose verdict is already known, i.e. they
+    have been tested with the same EXEC, spec and config before, and reports
+    the recorded verdict instead. Verdicts are recorded in
+    `.cache/results.sqlite3` on every run.
+
+   *`--failed-first` tests the testcases which failed last time (with any
+    executable) before the others in every testset.
+
+   *`-j NUM` runs NUM testcases at the same time, `0` meaning one per core.
+    Cases from every testset share the worker pool while results are still
+    reported in the order of a sequential run. Among the next 16*NUM cases,
+    the longest are started first, by their mean duration recorded in
+    `.cache/results.sqlite3` or else by the size of their input, so that a long
+    case does not finish last on its own; `--schedule order` starts them in
+    order instead.
+
+   *`--workers NUM` runs the testcases on NUM worker processes of one slot
+    each, fed over TCP, as `--listen HOST:PORT` does on the workers started by
+    `python test.py worker HOST:PORT` on other machines, each with a copy of
+    test.py. Executables, inputs and expected outputs are sent by their
+    sha256 and kept in `.cache/blobs` of the worker, so that each of them is
+    only sent once. Workers run whatever executable they are sent, so only
+    start them for a test you trust.
+
+   *`-s SEED` makes random testcases reproducible: every case only depends on
+    SEED and its index. The seed is printed if not given, and `--case NUM`
+    regenerates and tests only the NUM-th random testcase of `-r`.
+
+   *`-g NUM` generates random testcases in NUM worker processes, at most
+    `--prefetch NUM` cases ahead of the execution, so that a heavy generator
+    does not stall the executable under test.
+
+   *`--save-cases` stores every random testcase, and `--save-failing` every
+    failed one including the counterexample of `--stress`, in the corpus of
+    the problem, `corpus.dat` and `corpus.idx` in `<LABID>/test/<PROBID>/`.
+    `--replay all|generated|failing` then tests the stored testcases, or the
+    ones stored by either option, without running the generator. Default
+    testcases are only tested along with `-R`.
+
+   *`--profile` times the phases of every testcase: generating (or loading)
+    it, spawning EXEC, running it, verifying the output and reporting, and
+    prints how the time is shared among them. `--profile-spec` profiles the
+    code of the spec, i.e. generators and verifiers, with cProfile as well.
+    `--trace PATH` writes the spans as a Chrome trace, to be opened in
+    chrome://tracing or Perfetto.
+
+   *`--watch` keeps running and tests EXEC again as soon as it or anything in
+    `<LABID>/test/<PROBID>/` changes, watched by inotify (or by polling where
+    it is not available). The spec, the default testcases and the outputs of
+    `-m SID` stay in memory, and only the testcases whose verdict may have
+    changed are tested again, as with `--changed-only`.
+
+   *`--report progress` prints a progress bar and the failed testcases only
+    instead of a line for every testcase. `--jsonl PATH` and `--junit PATH`
+    additionally write the verdicts to PATH as JSON lines or JUnit XML.
+
+   *`--all` tests every executable `<LABID>/<SID>/<PROBID>` of every problem,
+    or of PROBID only if given, in a single process, skipping empty and
+    non-executable files, and prints a summary. EXEC is not needed then.
+
+   *`--grade` grades every submission `<LABID>/<SID>/<PROBID>` on the same
+    testcases, each generated once and, with `-m SID`, matched with the
+    output of SID computed once. Submissions run on one worker per core
+    unless `-j NUM` is given, and a SID x testcase verdict matrix is printed.
+
+`test bench LABID PROBID EXEC...` measures executables, including those of
+other students given by `-m SID`, on random testcases of the sizes given by
+`--sizes`, reports the median, p95 and p99 of the CPU time with the peak RSS
+(`-`, or null in `--json`, when below the footprint of test.py itself, unless
+a cgroup with the memory controller measures it) and fits the empirical
+complexity. See `python test.py bench --help`.
 """
 
 
+class Reporter:
+    """Receives the progress of a test through the hooks below
+
+    The hooks are called in the order of a sequential run, whatever the number
+    of jobs: `pre_test` once, then `pre_testset`, `pre_testcase` and
+    `post_testcase` for every case, `post_testset` and finally `post_test`.
+    Verdicts are counted per Status as they come, in `counts` for the current
+    testset and in `acc_counts` for the whole test.
+    """
+
+    def pre_test(self, args, testsets, match=False):
+        self.args = args
+        self.testsets = testsets
+        self.acc_counts = Counter()
+
+    def pre_testset(self, testset_name, match=False):
+        self.testset_name = testset_name
+        self.counts = Counter()
+
+    def pre_testcase(self, casename, case_input, match=False):
+        self.casename = casename
+
+    def post_testcase(self, status, time, stderr=None, match=False, **kwargs):
+        self.counts[status] += 1
+
+    def post_testset(self, match=False):
+        self.acc_counts.update(self.counts)
+
+    def post_test(self, match=False):
+        pass
+
+
 class DefaultTheme:
     def __init__(self):
         # TODO: use logging module to optimize stderr and stdout
         self.testInfo = self._TestInfo()
         self.notify = self._Notify()
 
-    class _TestInfo:
+    class _TestInfo(Reporter):
         # Animation, decoration and print info when testing EXEC:
         def __init__(self):
             self.acc_testset_names: list
-            self.acc_status_dict: defaultdict
             self.testsets: list
             self.args: argparse.Namespace
             self.testset_name: str
-            self.status_dict: defaultdict
             self.casename: str
             self.case_input: str
             self.C_RED = "\033[31m"
             self.C_YEL = "\033[33m"
             self.C_RST = "\033[m"
 
-        def __unionDict(self, a, b):
-            # a is a defaultdict(list)
-            for k in b:
-                a[k] += b[k]
-
         def pre_test(self, args, testsets, match=False):
-            self.testsets = testsets
+            super().pre_test(args, testsets, match)
             self.acc_testset_names = [ts.name for ts in testsets]
-            self.acc_status_dict = defaultdict(list)
-            self.args = args
             print("Start to test")
 
         def pre_testset(self, testset_name, match=False):
-            self.testset_name = testset_name
-            self.status_dict = defaultdict(list)
+            super().pre_testset(testset_name, match)
             print(f"Testset {self.C_YEL}[{testset_name}]{self.C_RST} started")
 
         def pre_testcase(self, casename, case_input, match=False):
-            self.casename = casename
+            super().pre_testcase(casename, case_input, match)
             self.case_input = case_input
             print(f"Testing {self.C_YEL}{casename}{self.C_RST}... ", end="")
 
@@ -92,11 +286,30 @@ class DefaultTheme:
             match=False,
             **kwargs,
         ):
-            self.status_dict[status.value].append(self.casename)
+            super().post_testcase(status, time, stderr, match, **kwargs)
+            if kwargs.get("cached"):
+                print(f"{status.name} in {time*1000:.2f}ms (unchanged, skipped)")
+                return
+            memory = kwargs.get("memory")
             if status == Status.SUCCESS:
-                print(f"Passed in {time*1000:.2f}ms")
-            elif status == Status.WRONG_ANSWER:
-                print(f"WA\ncurrent:\n{self.C_RED}{kwargs['result']}{self.C_RED}")
+                if memory:
+                    print(f"Passed in {time*1000:.2f}ms, {memory/(1<<20):.2f}MB")
+                else:
+                    print(f"Passed in {time*1000:.2f}ms")
+            elif status == Status.MEMORY_LIMIT_EXCEEDED:
+                if memory:
+                    print(f"Memory Limit Exceeded ({memory/(1<<20):.2f}MB)")
+                else:
+                    print("Memory Limit Exceeded")
+            elif status == Status.WRONG_ANSWER and "result" in kwargs:
+                mismatch = kwargs.get("mismatch")
+                if mismatch is None:
+                    print("WA")
+                elif mismatch[1] is None:
+                    print(f"WA at byte {mismatch[0]}")
+                else:
+                    print(f"WA at line {mismatch[1]} (byte {mismatch[0]})")
+                print(f"current:\n{self.C_RED}{kwargs['result']}{self.C_RED}")
                 print(
                     f"expected:\n{self.C_YEL}{kwargs['expected'].strip()}{self.C_RST}"
                 )
@@ -107,13 +320,9 @@ class DefaultTheme:
                 print(status)
 
         def post_testset(self, match=False):
-            success_num = 0
-            tot_num = 0
-            for status in self.status_dict:
-                if status == Status.SUCCESS.value:
-                    success_num += len(self.status_dict[status])
-                tot_num += len(self.status_dict[status])
-            self.__unionDict(self.acc_status_dict, self.status_dict)
+            super().post_testset(match)
+            success_num = self.counts[Status.SUCCESS]
+            tot_num = sum(self.counts.values())
             if tot_num == 0:
                 print(f"Testset [{self.testset_name}]")
             else:
@@ -122,13 +331,12 @@ class DefaultTheme:
                 )
 
         def post_test(self, match=False):
-            success_num = 0
-            tot_num = 0
-            for status_v in self.acc_status_dict:
-                if status_v == Status.SUCCESS.value:
-                    success_num += len(self.acc_status_dict[status_v])
-                tot_num += len(self.acc_status_dict[status_v])
-            txt = f"Totally passed {success_num*100.0/tot_num:.2f}% ({success_num}/{tot_num}) in "
+            success_num = self.acc_counts[Status.SUCCESS]
+            tot_num = sum(self.acc_counts.values())
+            if tot_num == 0:
+                txt = "Totally tested nothing in "
+            else:
+                txt = f"Totally passed {success_num*100.0/tot_num:.2f}% ({success_num}/{tot_num}) in "
             first = True
             for tn in self.acc_testset_names:
                 if first:
@@ -161,33 +369,387 @@ class DefaultTheme:
                 sys.exit(1)
 
 
+class ProgressReporter(Reporter):
+    """Prints a progress bar, updated in place, and only the failed testcases
+
+    Writing a line for every testcase easily costs more than running it when
+    there are thousands of tiny ones, so the bar is redrawn at most every
+    `INTERVAL` seconds, and only once per testset if the stream is not a tty.
+    """
+
+    WIDTH = 30
+    INTERVAL = 0.1
+    C_RED = "\033[31m"
+    C_YEL = "\033[33m"
+    C_RST = "\033[m"
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.tty = self.stream.isatty()
+
+    def pre_test(self, args, testsets, match=False):
+        super().pre_test(args, testsets, match)
+        try:
+            self.total = sum(len(ts) for ts in testsets)
+        except TypeError:
+            self.total = None
+        self.done = self.failed = 0
+        self.start = self.drawn = time.monotonic()
+
+    def post_testcase(self, status, time, stderr=None, match=False, **kwargs):
+        super().post_testcase(status, time, stderr, match, **kwargs)
+        self.done += 1
+        if status != Status.SUCCESS:
+            self.failed += 1
+            self._clear()
+            txt = f"{self.C_RED}{status.name}{self.C_RST} {self.C_YEL}[{self.testset_name}] {self.casename}{self.C_RST}"
+            mismatch = kwargs.get("mismatch")
+            if mismatch is not None and mismatch[1] is not None:
+                txt += f" at line {mismatch[1]} (byte {mismatch[0]})"
+            elif mismatch is not None:
+                txt += f" at byte {mismatch[0]}"
+            if kwargs.get("cached"):
+                txt += " (unchanged, skipped)"
+            self.stream.write(txt + "\n")
+            if stderr:
+                self.stream.write(stderr.rstrip() + "\n")
+        if self.tty:
+            self._draw(False)
+
+    def post_testset(self, match=False):
+        super().post_testset(match)
+        self._draw(True)
+
+    def post_test(self, match=False):
+        self._clear()
+        counts = self.acc_counts
+        tot_num = sum(counts.values())
+        txt = ", ".join(f"{counts[s]} {s.name}" for s in Status if counts[s])
+        elapsed = time.monotonic() - self.start
+        self.stream.write(f"Tested {tot_num} testcases in {elapsed:.2f}s: {txt}\n")
+        self.stream.flush()
+
+    def _clear(self):
+        if self.tty:
+            self.stream.write("\r\033[K")
+
+    def _draw(self, force):
+        now = time.monotonic()
+        if not force and now - self.drawn < self.INTERVAL:
+            return
+        self.drawn = now
+        if self.total:
+            filled = self.done * self.WIDTH // self.total
+            bar = f"[{'#' * filled}{'.' * (self.WIDTH - filled)}] {self.done}/{self.total}"
+        else:
+            bar = f"{self.done}"
+        rate = self.done / max(now - self.start, 1e-9)
+        txt = f"{bar} failed {self.failed} ({rate:.0f} cases/s)"
+        if self.tty:
+            self.stream.write("\r\033[K" + txt)
+            self.stream.flush()
+        elif force:
+            self.stream.write(f"[{self.testset_name}] {txt}\n")
+
+
+class JSONLReporter(Reporter):
+    """Writes a JSON object per testcase to the file `path`, one per line
+
+    The file is truncated once, so that the records of all the tests of a
+    run, e.g. with `--all`, are kept, each naming its problem and EXEC.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def pre_test(self, args, testsets, match=False):
+        super().pre_test(args, testsets, match)
+        if self.file is None:
+            self.file = open(self.path, "w", buffering=1 << 20)
+
+    def post_testcase(self, status, time, stderr=None, match=False, **kwargs):
+        super().post_testcase(status, time, stderr, match, **kwargs)
+        mismatch = kwargs.get("mismatch")
+        record = {
+            "problem": f"{self.args.LABID}/{self.args.PROBID}",
+            "exec": str(self.args.EXEC),
+            "testset": self.testset_name,
+            "testcase": self.casename,
+            "status": status.name,
+            "time": time,
+            "memory": kwargs.get("memory") or None,
+            "cached": bool(kwargs.get("cached")),
+        }
+        if mismatch is not None:
+            record["offset"], record["line"] = mismatch
+        self.file.write(json.dumps(record) + "\n")  # type: ignore
+
+    def post_test(self, match=False):
+        self.file.flush()  # type: ignore
+
+
+class JUnitReporter(Reporter):
+    """Writes a JUnit XML report to the file `path` once the test is over
+
+    Every testset becomes a <testsuite> with the EXEC tested as a property.
+    The suites of all the tests of a run, e.g. with `--all`, are kept, the
+    file being written again after every test. Wrong answers are reported
+    as failures and the other verdicts except success as errors.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.root = None
+        self.total = Counter()
+
+    def pre_test(self, args, testsets, match=False):
+        super().pre_test(args, testsets, match)
+        if self.root is None:
+            self.root = ET.Element("testsuites", name=args.LABID)
+        self.suite = None
+
+    def pre_testset(self, testset_name, match=False):
+        super().pre_testset(testset_name, match)
+        self.suite = ET.SubElement(
+            self.root,  # type: ignore
+            "testsuite",
+            name=f"{self.args.PROBID}.{testset_name}",
+        )
+        props = ET.SubElement(self.suite, "properties")
+        ET.SubElement(props, "property", name="exec", value=str(self.args.EXEC))
+        self.suite_time = 0.0
+
+    def post_testcase(self, status, time, stderr=None, match=False, **kwargs):
+        super().post_testcase(status, time, stderr, match, **kwargs)
+        self.suite_time += time
+        case = ET.SubElement(
+            self.suite,  # type: ignore
+            "testcase",
+            classname=f"{self.args.LABID}.{self.args.PROBID}.{self.testset_name}",
+            name=str(self.casename),
+            time=f"{time:.6f}",
+        )
+        if status == Status.SUCCESS:
+            return
+        tag = "failure" if status == Status.WRONG_ANSWER else "error"
+        fail = ET.SubElement(case, tag, type=status.name, message=status.name)
+        mismatch = kwargs.get("mismatch")
+        if mismatch is not None:
+            fail.set("message", f"{status.name} at byte {mismatch[0]}")
+        if "result" in kwargs:
+            fail.text = f"current:\n{kwargs['result']}\nexpected:\n{kwargs['expected']}"
+        if stderr:
+            ET.SubElement(case, "system-err").text = stderr
+
+    def post_testset(self, match=False):
+        super().post_testset(match)
+        self._summarize(self.suite, self.counts, self.suite_time)  # type: ignore
+
+    def post_test(self, match=False):
+        self.total.update(self.acc_counts)
+        self._summarize(
+            self.root,
+            self.total,
+            sum(float(s.get("time", 0)) for s in self.root),  # type: ignore
+        )
+        ET.ElementTree(self.root).write(
+            self.path, encoding="utf-8", xml_declaration=True
+        )
+
+    @staticmethod
+    def _summarize(elem, counts, duration):
+        elem.set("tests", str(sum(counts.values())))
+        elem.set("failures", str(counts[Status.WRONG_ANSWER]))
+        elem.set(
+            "errors",
+            str(
+                sum(counts.values())
+                - counts[Status.SUCCESS]
+                - counts[Status.WRONG_ANSWER]
+            ),
+        )
+        elem.set("time", f"{duration:.6f}")
+
+
+class FanoutReporter(Reporter):
+    """Passes every hook on to all of `reporters` in turn, counting as well"""
+
+    def __init__(self, reporters):
+        self.reporters = reporters
+
+    def pre_test(self, args, testsets, match=False):
+        super().pre_test(args, testsets, match)
+        for r in self.reporters:
+            r.pre_test(args, testsets, match)
+
+    def pre_testset(self, testset_name, match=False):
+        super().pre_testset(testset_name, match)
+        for r in self.reporters:
+            r.pre_testset(testset_name, match)
+
+    def pre_testcase(self, casename, case_input, match=False):
+        for r in self.reporters:
+            r.pre_testcase(casename, case_input, match)
+
+    def post_testcase(self, status, time, stderr=None, match=False, **kwargs):
+        super().post_testcase(status, time, stderr, match, **kwargs)
+        for r in self.reporters:
+            r.post_testcase(status, time, stderr, match, **kwargs)
+
+    def post_testset(self, match=False):
+        super().post_testset(match)
+        for r in self.reporters:
+            r.post_testset(match)
+
+    def post_test(self, match=False):
+        for r in self.reporters:
+            r.post_test(match)
+
+
+def make_reporter(args, theme):
+    # the reporter selected by --report, with --jsonl and --junit writers
+    if args.report == "progress":
+        reporters = [ProgressReporter()]
+    else:
+        reporters = [theme.testInfo]
+    if args.jsonl:
+        reporters.append(JSONLReporter(args.jsonl))
+    if args.junit:
+        reporters.append(JUnitReporter(args.junit))
+    if len(reporters) == 1:
+        return reporters[0]
+    return FanoutReporter(reporters)
+
+
 _THEME = DefaultTheme()
+_CACHE_DIR = Path(__file__).parent / ".cache"
+
+
+@functools.lru_cache(maxsize=64)
+def _skip_tokens(n, is_str):
+    # matches the next n tokens of a StrReader with the whitespace before them
+    pattern = r"(?:[ \n\t\r]*[^ \n\t\r]+){%d}" % n
+    return re.compile(pattern if is_str else pattern.encode())
 
 
 class StrReader:
+    """Read whitespace separated tokens from a str, bytes or mmap buffer
+
+    Tokens are located by a compiled regular expression instead of scanning
+    characters in Python, and the bulk methods consume many tokens within a
+    single call. Tokens are always returned as strings.
+    """
+
+    _TOKEN = re.compile(r"[^ \n\t\r]+")
+    _BYTES_TOKEN = re.compile(rb"[^ \n\t\r]+")
+    _SEP = re.compile(r"[ \n\t\r]")
+    _BYTES_SEP = re.compile(rb"[ \n\t\r]")
+
     def __init__(self, txt) -> None:
         self.txt = txt
         self.pointer = 0
         self.end = len(txt)
         self.IFS = [" ", "\n", "\t", "\r"]
+        self.is_str = isinstance(txt, str)
+        self.token = self._TOKEN if self.is_str else self._BYTES_TOKEN
+        self.sep = self._SEP if self.is_str else self._BYTES_SEP
+        self.width = 8.0  # estimated characters per token, see _read_raw_tokens
+
+    def _exhausted(self):
+        self.pointer = self.end
+        return BufferError("Nothing to read any more")
+
+    def _read_raw(self):
+        m = self.token.search(self.txt, self.pointer)
+        if m is None:
+            raise self._exhausted()
+        self.pointer = m.end()
+        return m.group()
+
+    def _boundary(self, pos):
+        # the first separator at or after `pos`, so that no token is cut
+        if pos >= self.end:
+            return self.end
+        m = self.sep.search(self.txt, pos)
+        return self.end if m is None else m.start()
+
+    def _read_raw_tokens(self, n):
+        tokens = list()
+        while len(tokens) < n:
+            if self.pointer >= self.end:
+                raise self._exhausted()
+            need = n - len(tokens)
+            span = min(1 << 16, max(64, int(self.width * need)))
+            stop = self._boundary(self.pointer + span)
+            found = self.token.findall(self.txt, self.pointer, stop)
+            if found:
+                # aim a little short next time, as overshooting costs a rescan
+                self.width = 0.95 * (stop - self.pointer) / len(found)
+            if len(found) <= need:
+                tokens += found
+                self.pointer = stop
+                continue
+            tokens += found[:need]
+            skip = _skip_tokens(need, self.is_str)
+            self.pointer = skip.match(self.txt, self.pointer).end()
+        return tokens
 
     def read(self):
-        if self.pointer == self.end:
-            raise BufferError("Nothing to read any more")
-        while self.txt[self.pointer] in self.IFS:
-            self.pointer += 1
-            if self.pointer == self.end:
-                raise BufferError("Nothing to read any more")
-        start = self.pointer
-        while self.pointer != self.end and self.txt[self.pointer] not in self.IFS:
-            self.pointer += 1
-        return self.txt[start : self.pointer]
+        tok = self._read_raw()
+        return tok if self.is_str else tok.decode()
 
     def read_ch(self):
         if self.pointer == self.end:
             raise BufferError("Nothing to read any more")
         self.pointer += 1
-        return self.txt[self.pointer - 1]
+        ch = self.txt[self.pointer - 1 : self.pointer]
+        return ch if self.is_str else ch.decode("latin-1")
+
+    def read_int(self):
+        return int(self._read_raw())
+
+    def read_ints(self, n):
+        return list(map(int, self._read_raw_tokens(n)))
+
+    def read_tokens(self, n):
+        tokens = self._read_raw_tokens(n)
+        if self.is_str:
+            return tokens
+        return [tok.decode() for tok in tokens]
+
+    def at_end(self):
+        """Whether nothing but whitespace is left"""
+        return self.token.search(self.txt, self.pointer) is None
+
+
+def name_ids(names):
+    """Map every name in the list `names` to its index"""
+    return {name: i for i, name in enumerate(names)}
+
+
+def rank_table(prefs):
+    """Inverse permutations of the preference lists `prefs`
+
+    `prefs` holds N lists of the integer ids 0, ..., M-1, best first, e.g.
+    names read by `StrReader.read_tokens` translated by `name_ids`. In the
+    returned table, `ranks[i][j]` is the position of j in `prefs[i]`, so that
+    two preferences of i are compared in O(1) rather than by list scans. The
+    table is an N x M array if NumPy is available, or a list of `array("l")`.
+    """
+    if np is not None:
+        prefs = np.asarray(prefs, dtype=np.int64)
+        n, m = prefs.shape
+        ranks = np.empty_like(prefs)
+        ranks[np.arange(n)[:, None], prefs] = np.arange(m)
+        return ranks
+    ranks = list()
+    for pref in prefs:
+        row = [0] * len(pref)
+        for k, j in enumerate(pref):
+            row[j] = k
+        ranks.append(array("l", row))
+    return ranks
 
 
 class TestSet:
@@ -205,11 +767,12 @@ class TestSet:
         """
         Returns: (casename, unit_case, verifier)
             casename (string): name of the testcase
-            unit_case (string): directed to stdin of the tested program
-            verifier (string|Callable[[string], bool]) : either a string used to
-                match the stdout or a function to verify whether the output is
-                reasonable (usually used when the problem has multiple
-                solutions)
+            unit_case (string|Path): directed to stdin of the tested program,
+                a Path meaning the content of the file which is streamed
+            verifier (string|Path|Callable[[string], bool]) : either a string
+                (or a Path to a file) used to match the stdout or a function to
+                verify whether the output is reasonable (usually used when the
+                problem has multiple solutions)
         """
         raise NotImplementedError()
 
@@ -220,9 +783,16 @@ class TestSet:
         raise NotImplementedError()
 
 
+# files of testcases larger than this (in bytes) are not loaded into memory
+STREAM_THRESHOLD = 8 << 20
+
+
 class DefaultTestSet(TestSet):
     """get test data from given fils in <labID>/test/<problemID>/<testcaseID>"""
 
+    # (mtime, size, content) of the files by path if not None, see Watcher
+    cache = None
+
     def __init__(self, labID, problemID, spec):
         super().__init__("Default", labID, problemID)
         self.data_dir = Path(__file__).parent / labID / "test" / problemID
@@ -230,6 +800,7 @@ class DefaultTestSet(TestSet):
         self.length = len(self.glob_list)
         self.pointer = 0
         self.spec = spec
+        self.stream_threshold = STREAM_THRESHOLD
 
     def __next__(self):
         if self.pointer == self.length:
@@ -238,44 +809,1361 @@ class DefaultTestSet(TestSet):
         self.pointer += 1
         tc_ip = self.glob_list[p]
         tc_name = tc_ip.stem
-        tc_input = tc_ip.read_text()
+        tc_input = self._load(tc_ip)
         tc_op = tc_ip.parent / (tc_name + ".out")
         if tc_op.is_file():
-            verifier = tc_op.read_text()
+            verifier = self._load(tc_op)
         else:
             verifier = self.spec.verifier
         return (tc_name, tc_input, verifier)
 
+    def _load(self, p):
+        # large files are streamed from the disk when testing
+        st = p.stat()
+        if st.st_size > self.stream_threshold:
+            return p
+        if self.cache is None:
+            return p.read_text()
+        cached = self.cache.get(p)
+        if cached is None or cached[:2] != (st.st_mtime_ns, st.st_size):
+            cached = self.cache[p] = (st.st_mtime_ns, st.st_size, p.read_text())
+        return cached[2]
+
     def __len__(self):
         return self.length
 
 
 class RandomTestSetBase(TestSet):
-    """Every RandomTestSet should inherit from this class"""
+    """Every RandomTestSet should inherit from this class
+
+    Its `generate` ought to draw from `self.rng`, a `random.Random` seeded
+    for every case, or from `self.np_rng`, a NumPy Generator seeded likewise,
+    for bulk arrays, so that a case only depends on `seed` and its index. Any
+    case can thus be regenerated alone by `case`, and disjoint ranges of cases
+    can be generated in different processes. Iterating yields the `num` cases
+    from the index `first` on, see `select`.
+    """
 
     def __init__(self, labID, problemID, case_num, testset_name="Random"):
         super().__init__(testset_name, labID, problemID)
         self.case_num = case_num
+        self.first = 0
         self.cnt = 0
         self.num = case_num
+        self.seed = None  # drawn when the first case is generated if not set
+        self.size = None  # size of the cases to generate, if supported
+        self.rng = random.Random()
+        self._np_rng = None
 
     def __len__(self):
         return self.num
 
     def __next__(self):
-        if self.cnt == self.num:
+        if self.cnt == self.first + self.num:
             raise StopIteration
-        self.cnt += 1
-        return self.generate()
+        return self.case(self.cnt)
+
+    def select(self, first, num):
+        """Only iterate over the `num` cases from the 0-based index `first`"""
+        self.first = self.cnt = first
+        self.num = num
+
+    def case(self, index):
+        """Generate the case with the 0-based `index`
+
+        `cnt` is 1-based inside `generate` as it used to be. Specs drawing
+        from the global `random` are reproducible as well, as it is seeded the
+        same way during `generate` and restored afterwards.
+        """
+        if self.seed is None:
+            self.seed = random.getrandbits(63)
+        self.cnt = index + 1
+        key = f"{self.seed}:{index}"
+        self.rng.seed(key)
+        self._np_rng = None
+        state = random.getstate()
+        random.seed(key)
+        try:
+            return self.generate()
+        finally:
+            random.setstate(state)
+
+    @property
+    def np_rng(self):
+        """NumPy Generator for the current case, created on first use"""
+        if np is None:
+            raise RuntimeError("NumPy is required by this RandomTestSet")
+        if self._np_rng is None:
+            key = f"{self.seed}:{self.cnt - 1}".encode()
+            entropy = int.from_bytes(hashlib.sha256(key).digest()[:16], "big")
+            self._np_rng = np.random.default_rng(entropy)
+        return self._np_rng
 
     def generate(self):
         raise NotImplementedError
 
 
+def _prefetch_worker(src_set, worker_id, workers, out_queue):
+    first = src_set.first
+    for index in range(first + worker_id, first + len(src_set), workers):
+        try:
+            out_queue.put(("case", src_set.case(index)))
+        except Exception as e:
+            out_queue.put(("error", f"{type(e).__name__}: {e}"))
+            return
+
+
+class PrefetchTestSet(TestSet):
+    """Generate cases of a RandomTestSetBase in worker processes ahead of use
+
+    Worker `k` generates the cases whose index is `k` modulo the number of
+    workers and puts them into its own bounded queue, which are then consumed
+    round-robin so that the order of cases is the same as that of the source.
+    """
+
+    def __init__(self, src_set: RandomTestSetBase, workers, prefetch=64):
+        super().__init__(src_set.name, src_set.labID, src_set.problemID)
+        if src_set.seed is None:
+            # forked workers would otherwise share the state of `random`
+            src_set.seed = random.getrandbits(64)
+        self.src_set = src_set
+        self.num = len(src_set)
+        self.cnt = 0
+        self.workers = max(1, min(workers, self.num))
+        ctx = multiprocessing.get_context("fork")
+        self.queues = []
+        self.procs = []
+        for worker_id in range(self.workers):
+            q = ctx.Queue(maxsize=max(1, prefetch // self.workers))
+            proc = ctx.Process(
+                target=_prefetch_worker,
+                args=(src_set, worker_id, self.workers, q),
+                daemon=True,
+            )
+            proc.start()
+            self.queues.append(q)
+            self.procs.append(proc)
+
+    def __len__(self):
+        return self.num
+
+    def __next__(self):
+        if self.cnt == self.num:
+            self.close()
+            raise StopIteration
+        worker_id = self.cnt % self.workers
+        while True:
+            try:
+                kind, payload = self.queues[worker_id].get(timeout=1)
+                break
+            except queue.Empty:
+                if not self.procs[worker_id].is_alive():
+                    self.close()
+                    raise RuntimeError(f"generator worker {worker_id} died")
+        if kind == "error":
+            self.close()
+            index = self.src_set.first + self.cnt
+            raise RuntimeError(f"failed to generate testcase {index}: {payload}")
+        self.cnt += 1
+        return payload
+
+    def close(self):
+        for proc in self.procs:
+            if proc.is_alive():
+                proc.terminate()
+            proc.join()
+        self.procs = []
+
+
+class Corpus:
+    """Append-only store of testcases in `<labID>/test/<problemID>/`
+
+    `corpus.dat` holds the inputs and expected outputs of the testcases one
+    after another, each compressed by zlib on its own so that any testcase
+    can be read alone, and `corpus.idx` a JSON line per testcase with its
+    name, tag ("generated" or "failing"), the offsets and sizes of its
+    records and a digest, which avoids storing a testcase twice under the
+    same tag. Data is appended before the index, so that an interrupted
+    append leaves at most a torn last line, which is ignored and cut off
+    before the next append.
+    """
+
+    def __init__(self, labID, problemID):
+        data_dir = Path(__file__).parent / labID / "test" / problemID
+        self.dat_p = data_dir / "corpus.dat"
+        self.idx_p = data_dir / "corpus.idx"
+        self.entries = list()
+        self.idx_size = 0  # bytes of the index up to the last complete entry
+        if self.idx_p.is_file():
+            with open(self.idx_p, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        self.entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        break
+                    self.idx_size += len(line)
+        self.keys = {(e["digest"], e["tag"]) for e in self.entries}
+        self.dat = None
+        self.idx = None
+
+    def entries_tagged(self, tag=None):
+        return [e for e in self.entries if tag is None or e["tag"] == tag]
+
+    def add(self, casename, unit_case, expected, tag):
+        """Store a testcase unless it is stored under `tag` already
+
+        `unit_case` and `expected` are strings or Paths, `expected` being None
+        if the output has to be checked by the verifier of the spec.
+        """
+        data = [_read_text(unit_case), _read_text(expected)]
+        h = hashlib.sha256(data[0].encode())
+        h.update(b"\0" if data[1] is None else data[1].encode())
+        digest = h.hexdigest()
+        if (digest, tag) in self.keys:
+            return False
+        if self.dat is None:
+            self.dat = open(self.dat_p, "ab")
+            self.idx = open(self.idx_p, "a")
+            self.idx.truncate(self.idx_size)
+        entry = {"name": str(casename), "tag": tag, "digest": digest}
+        for field, txt in zip(("in", "out"), data):
+            if txt is None:
+                entry[field] = None
+                continue
+            blob = zlib.compress(txt.encode(), 6)
+            entry[field] = [self.dat.seek(0, os.SEEK_END), len(blob)]
+            self.dat.write(blob)
+        self.dat.flush()
+        self.idx.write(json.dumps(entry) + "\n")  # type: ignore
+        self.idx.flush()  # type: ignore
+        self.entries.append(entry)
+        self.keys.add((digest, tag))
+        return True
+
+    def read(self, entry, field, dat):
+        # the decompressed text of a record of `entry` from the open `dat`
+        if entry[field] is None:
+            return None
+        offset, size = entry[field]
+        dat.seek(offset)
+        return _to_text(zlib.decompress(_read_exact(dat, size)))
+
+    def close(self):
+        for f in (self.dat, self.idx):
+            if f is not None:
+                f.close()
+        self.dat = self.idx = None
+
+
+def _read_text(case):
+    if isinstance(case, Path):
+        return case.read_text()
+    return case
+
+
+class CorpusTestSet(TestSet):
+    """Replays the testcases stored in the `Corpus` of the problem
+
+    Only the index is read upfront, every testcase is decompressed when it
+    is reached. Testcases without an expected output are checked by the
+    verifier of the spec.
+    """
+
+    def __init__(self, labID, problemID, spec, tag=None):
+        super().__init__("Corpus", labID, problemID)
+        self.corpus = Corpus(labID, problemID)
+        self.entries = self.corpus.entries_tagged(tag)
+        self.spec = spec
+        self.pointer = 0
+        self.dat = None
+
+    def __next__(self):
+        if self.pointer == len(self.entries):
+            if self.dat is not None:
+                self.dat.close()
+                self.dat = None
+            raise StopIteration
+        if self.dat is None:
+            self.dat = open(self.corpus.dat_p, "rb")
+        entry = self.entries[self.pointer]
+        self.pointer += 1
+        unit_case = self.corpus.read(entry, "in", self.dat)
+        verifier = self.corpus.read(entry, "out", self.dat)
+        if verifier is None:
+            verifier = self.spec.verifier
+        return (entry["name"], unit_case, verifier)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise EOFError(f"expected {size} bytes but got {len(data)}")
+    return data
+
+
+def _parse_value(txt):
+    for conv in (int, float):
+        try:
+            return conv(txt)
+        except ValueError:
+            pass
+    return txt
+
+
+class NativeChecker:
+    """Verifier backed by the `check` command of a compiled `spec.out`"""
+
+    def __init__(self, spec_p):
+        self.spec_p = spec_p
+
+    def __call__(self, input, output) -> bool:
+        """`input` and `output` are strings, Paths or binary files"""
+        with contextlib.ExitStack() as stack:
+            args, fds = list(), list()
+            for content in (input, output):
+                if isinstance(content, Path):
+                    args.append(str(content))
+                    continue
+                if isinstance(content, str):
+                    f = stack.enter_context(tempfile.TemporaryFile())
+                    f.write(content.encode())
+                    f.flush()
+                else:
+                    f = content
+                f.seek(0)
+                fds.append(f.fileno())
+                args.append(f"/dev/fd/{f.fileno()}")
+            rc = subprocess.run(
+                [str(self.spec_p), "check", *args], pass_fds=fds
+            ).returncode
+        if rc not in (0, 1):
+            raise RuntimeError(f"{self.spec_p} check exited with {rc}")
+        return rc == 0
+
+
+class NativeRandomTestSet(RandomTestSetBase):
+    """RandomTestSet backed by the `generate` command of a compiled `spec.out`
+
+    The generator runs in its own process and streams all the cases through a
+    pipe, so it is pipelined with the execution by nature.
+    """
+
+    def __init__(self, spec_p, labID, problemID, case_num, checker=None):
+        super().__init__(labID, problemID, case_num)
+        self.spec_p = spec_p
+        self.checker = checker
+        self.proc = None
+
+    def __next__(self):
+        end = self.first + self.num
+        if self.cnt == end:
+            self.close()
+            raise StopIteration
+        if self.proc is None:
+            self.proc = self._generator(self.cnt, end - self.cnt)
+        self.cnt += 1
+        return self._read_case(self.proc.stdout)
+
+    def case(self, index):
+        self.cnt = index + 1
+        proc = self._generator(index, 1)
+        try:
+            return self._read_case(proc.stdout)
+        finally:
+            proc.stdout.close()  # type: ignore
+            proc.wait()
+
+    def _generator(self, first, num):
+        if self.seed is None:
+            self.seed = random.getrandbits(63)
+        cmd = [str(self.spec_p), "generate", str(self.seed), str(first), str(num)]
+        if self.size is not None:
+            cmd.append(str(self.size))
+        return subprocess.Popen(cmd, stdout=subprocess.PIPE)
+
+    def _read_case(self, stream):
+        header = stream.readline().split()
+        if len(header) != 3:
+            raise RuntimeError(f"malformed testcase header from {self.spec_p}")
+        casename = header[0].decode()
+        unit_case = _to_text(_read_exact(stream, int(header[1])))
+        if int(header[2]) < 0:
+            return (casename, unit_case, self.checker)
+        return (casename, unit_case, _to_text(_read_exact(stream, int(header[2]))))
+
+    def close(self):
+        if self.proc is not None:
+            self.proc.stdout.close()  # type: ignore
+            self.proc.kill()
+            self.proc.wait()
+            self.proc = None
+
+
+class NativeSpec:
+    """Exposes a compiled `spec.out` with the interface of a `spec.py` module"""
+
+    def __init__(self, spec_p):
+        self.spec_p = spec_p
+        self.verifier = NativeChecker(spec_p)
+
+    def get_config(self):
+        complete_ps = subprocess.run(
+            [str(self.spec_p), "config"], capture_output=True, text=True, check=True
+        )
+        config = dict()
+        for line in complete_ps.stdout.splitlines():
+            kv = line.split(maxsplit=1)
+            if len(kv) == 2:
+                config[kv[0]] = _parse_value(kv[1].strip())
+        return config
+
+    def RandomTestSet(self, labID, problemID, case_num):
+        return NativeRandomTestSet(
+            self.spec_p, labID, problemID, case_num, self.verifier
+        )
+
+
+def file_digest(path):
+    """sha256 hex digest of the content of the file at `path`"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class RefOutputCache:
+    """On-disk cache of reference outputs used by the matching test
+
+    An entry is keyed by the digest of the reference executable and that of the
+    input, stored as `<root>/<key[:2]>/<key>`. Reading an entry refreshes its
+    mtime and the least recently used entries are evicted once the cache grows
+    beyond `max_bytes`.
+    """
+
+    def __init__(self, root, max_bytes, in_memory=False):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.size = None
+        self.lock = threading.Lock()
+        # entries read or written are also kept in memory if `in_memory`
+        self.memory = dict() if in_memory else None
+
+    def key(self, exec_digest, unit_case):
+        h = hashlib.sha256(exec_digest.encode())
+        if isinstance(unit_case, Path):
+            h.update(file_digest(unit_case).encode())
+        else:
+            h.update(unit_case.encode())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return self.root / key[:2] / key
+
+    def get(self, key):
+        if self.memory is not None and key in self.memory:
+            return self.memory[key]
+        p = self._path(key)
+        try:
+            output = p.read_text()
+            os.utime(p)
+        except OSError:
+            return None
+        if self.memory is not None:
+            self.memory[key] = output
+        return output
+
+    def put(self, key, output):
+        if self.memory is not None:
+            self.memory[key] = output
+        p = self._path(key)
+        data = output.encode()
+        with self.lock:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            tmp_p = p.with_name(f"{key}.{os.getpid()}.tmp")
+            tmp_p.write_bytes(data)
+            os.replace(tmp_p, p)
+            if self.size is None:
+                self.size = sum(e.stat().st_size for e in self._entries())
+            else:
+                self.size += len(data)
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        return [e for e in self.root.glob("*/*") if not e.name.endswith(".tmp")]
+
+    def _evict(self):
+        entries = list()
+        for e in self._entries():
+            try:
+                st = e.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, e))
+        entries.sort()
+        self.size = sum(size for _, size, _ in entries)
+        # evict down to 3/4 of the capacity to avoid scanning on every put
+        for _, size, e in entries:
+            if self.size <= self.max_bytes * 3 // 4:
+                break
+            e.unlink(missing_ok=True)
+            self.size -= size
+
+
+def case_digest(unit_case, verifier):
+    """sha256 hex digest identifying the content of a testcase"""
+    h = hashlib.sha256()
+    for content in (unit_case, verifier):
+        if isinstance(content, Path):
+            h.update(b"file:" + file_digest(content).encode())
+        elif isinstance(content, str):
+            h.update(b"str:" + hashlib.sha256(content.encode()).digest())
+        elif isinstance(content, ReferenceRun):
+            h.update(b"reference:" + content.exec_digest.encode())
+        else:
+            # checked by the spec whose digest is part of the config digest
+            h.update(b"verifier")
+    return h.hexdigest()
+
+
+class ResultsDB:
+    """Verdicts of past runs kept in an SQLite database
+
+    A verdict is keyed by the digests of EXEC, of the testcase and of the spec
+    with its config, so that it remains valid as long as none of them changes.
+    Verdicts are buffered and written at once by `close`, so that a run never
+    holds the write lock while testing; if another run holds it for too long,
+    they are not recorded.
+    """
+
+    def __init__(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.rows = list()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "exec TEXT, testcase TEXT, config TEXT, status INTEGER, "
+            "duration REAL, updated REAL, PRIMARY KEY (exec, testcase, config))"
+        )
+
+    def get(self, exec_digest, case_digest, config_digest):
+        """Returns: (status, duration) or None if never tested"""
+        row = self.conn.execute(
+            "SELECT status, duration FROM results "
+            "WHERE exec = ? AND testcase = ? AND config = ?",
+            (exec_digest, case_digest, config_digest),
+        ).fetchone()
+        return None if row is None else (Status(row[0]), row[1])
+
+    def last_status(self, case_digest, config_digest):
+        """The latest verdict of a testcase with any executable"""
+        row = self.conn.execute(
+            "SELECT status FROM results WHERE testcase = ? AND config = ? "
+            "ORDER BY updated DESC LIMIT 1",
+            (case_digest, config_digest),
+        ).fetchone()
+        return None if row is None else Status(row[0])
+
+    def durations(self, config_digest):
+        """Mean recorded duration of every testcase with any executable
+
+        Returns: dict of case digest to seconds
+        """
+        return dict(
+            self.conn.execute(
+                "SELECT testcase, AVG(duration) FROM results WHERE config = ? "
+                "GROUP BY testcase",
+                (config_digest,),
+            )
+        )
+
+    def put(self, exec_digest, case_digest, config_digest, status, duration):
+        self.rows.append(
+            (
+                exec_digest,
+                case_digest,
+                config_digest,
+                status.value,
+                duration,
+                time.time(),
+            )
+        )
+
+    def close(self):
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                    self.rows,
+                )
+        except sqlite3.OperationalError:
+            pass  # locked by another run, these verdicts are not recorded
+        self.conn.close()
+
+
+class Profiler:
+    """Timings of the phases of a test for `--profile`
+
+    Spans of the phases "generate" (including loading default testcases),
+    "spawn" (fork and exec), "run" (until EXEC exits), "verify" and "report"
+    are recorded with the thread they ran in. Output streamed into the
+    comparison is verified while EXEC runs, so only what is left by then is
+    part of "verify". "report" is recorded in two spans, before and after
+    waiting for the result, counted as one. `current` is the profiler of the
+    running test, if any. With `spec_code`, the calls into the spec
+    (generators and verifiers) are profiled by cProfile as well, one at a
+    time.
+    """
+
+    PHASES = ("generate", "spawn", "run", "verify", "report")
+    current = None
+
+    def __init__(self, spec_code=False):
+        self.origin = time.perf_counter()
+        self.spans = list()  # (phase, thread id, start, end, casename, cont)
+        self.cprofile = cProfile.Profile() if spec_code else None
+        self.lock = threading.Lock()
+
+    def add(self, phase, start, name=None, cont=False):
+        # with `cont`, the span continues the last one of `phase` in the thread
+        self.spans.append(
+            (phase, threading.get_ident(), start, time.perf_counter(), name, cont)
+        )
+
+    def spec_call(self, fn, *args):
+        if self.cprofile is None:
+            return fn(*args)
+        with self.lock:
+            return self.cprofile.runcall(fn, *args)
+
+    def iterate(self, testset):
+        # the testcases of `testset`, timing the generation of each one
+        it = iter(testset)
+        while True:
+            start = time.perf_counter()
+            try:
+                case = self.spec_call(next, it)
+            except StopIteration:
+                return
+            self.add("generate", start, case[0])
+            yield case
+
+    def print_table(self):
+        wall = time.perf_counter() - self.origin
+        print(
+            f"{'phase':<10}{'count':>8}{'total':>11}{'mean':>11}{'max':>11}"
+            f"{'share':>8}"
+        )
+        for phase in self.PHASES:
+            durations, last = list(), dict()  # index of the last span by thread
+            for s in self.spans:
+                if s[0] != phase:
+                    continue
+                if s[5] and s[1] in last:
+                    durations[last[s[1]]] += s[3] - s[2]
+                    continue
+                last[s[1]] = len(durations)
+                durations.append(s[3] - s[2])
+            if not durations:
+                continue
+            total = sum(durations)
+            print(
+                f"{phase:<10}{len(durations):>8}{total:>10.3f}s"
+                f"{total / len(durations) * 1000:>9.3f}ms"
+                f"{max(durations) * 1000:>9.3f}ms{total / wall * 100:>7.1f}%"
+            )
+        print(f"in {wall:.3f}s of wall time, phases of parallel testcases overlap")
+        if self.cprofile is not None:
+            print("Spec code by cumulative time:")
+            pstats.Stats(self.cprofile).sort_stats("cumulative").print_stats(15)
+
+    def write_trace(self, path):
+        """Write the spans in the Chrome trace event format (chrome://tracing)"""
+        pid = os.getpid()
+        events = list()
+        for phase, tid, start, end, name, _ in self.spans:
+            event = {
+                "name": phase,
+                "cat": "test",
+                "ph": "X",
+                "ts": (start - self.origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": pid,
+                "tid": tid,
+            }
+            if name is not None:
+                event["args"] = {"case": str(name)}
+            events.append(event)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def _profile(phase, start, name=None, cont=False):
+    # record a span of `phase` from `start` until now when profiling
+    if Profiler.current is not None:
+        Profiler.current.add(phase, start, name, cont)
+
+
+class Cgroup:
+    """A cgroup v2 of its own for a single run of an executable
+
+    The executable joins it before exec, so that all its descendants, even
+    those leaving its process group, are accounted in `cpu_time` and
+    `memory_peak` and killed together by `kill`. "memory" and "pids" limits
+    are set when these controllers are delegated to the cgroup of this
+    process. `create` returns None when cgroup v2 is not mounted or
+    not writable.
+    """
+
+    enabled = True
+    _base = False  # the cgroup of this process once looked up, None if unusable
+    _counter = itertools.count()
+
+    def __init__(self, path):
+        self.path = path
+        self.procs = str(path / "cgroup.procs")
+        self.limits_pids = False  # whether "pids.max" is set
+
+    @classmethod
+    def base(cls):
+        if cls._base is False:
+            cls._base = None
+            try:
+                with open("/proc/self/mounts") as f:
+                    mounts = [l.split()[1] for l in f if l.split()[2] == "cgroup2"]
+                with open("/proc/self/cgroup") as f:
+                    own = next(l[3:].strip() for l in f if l.startswith("0::"))
+            except (OSError, StopIteration, IndexError):
+                return None
+            for mount in mounts:
+                path = Path(mount) / own.lstrip("/")
+                if path.is_dir() and os.access(path, os.W_OK):
+                    cls._base = path
+                    break
+        return cls._base
+
+    @classmethod
+    def create(cls, memory=None, pids=None):
+        base = cls.base() if cls.enabled else None
+        if base is None:
+            return None
+        path = base / f"shared_test-{os.getpid()}-{next(cls._counter)}"
+        try:
+            path.mkdir()
+        except OSError:
+            Cgroup._base = None
+            return None
+        cgroup = cls(path)
+        try:
+            controllers = (path / "cgroup.controllers").read_text().split()
+            if memory is not None and "memory" in controllers:
+                (path / "memory.max").write_text(str(memory))
+            if pids is not None and "pids" in controllers:
+                (path / "pids.max").write_text(str(pids))
+                cgroup.limits_pids = True
+        except OSError:
+            pass
+        return cgroup
+
+    def open_procs(self):
+        """File descriptor by which a child joins the cgroup, see `execute`"""
+        try:
+            return os.open(self.procs, os.O_WRONLY | os.O_CLOEXEC)
+        except OSError:
+            return None
+
+    def cpu_time(self):
+        with open(self.path / "cpu.stat") as f:
+            for line in f:
+                key, value = line.split()
+                if key == "usage_usec":
+                    return int(value) / 1e6
+        return 0.0
+
+    def memory_peak(self):
+        """Peak memory usage in bytes, 0 without the memory controller"""
+        try:
+            return int((self.path / "memory.peak").read_text())
+        except (OSError, ValueError):
+            return 0
+
+    def oom_killed(self):
+        """Whether a process was killed for exceeding `memory.max`"""
+        try:
+            with open(self.path / "memory.events") as f:
+                events = dict(line.split() for line in f)
+        except OSError:
+            return False
+        return int(events.get("oom_kill", 0)) > 0
+
+    def kill(self):
+        try:
+            (self.path / "cgroup.kill").write_text("1")
+            return
+        except OSError:
+            pass
+        try:
+            pids = (self.path / "cgroup.procs").read_text().split()
+        except OSError:
+            return
+        for pid in pids:
+            try:
+                os.kill(int(pid), signal.SIGKILL)
+            except OSError:
+                pass
+
+    def remove(self):
+        # the cgroup can only be removed once its processes are gone
+        for _ in range(100):
+            self.kill()
+            try:
+                self.path.rmdir()
+                return
+            except FileNotFoundError:
+                return
+            except OSError:
+                time.sleep(0.01)
+
+
+class Execution:
+    """Outcome of a run of an executable, see `execute`"""
+
+    def __init__(self):
+        self.returncode = 0
+        self.stdout = ""
+        self.stderr = ""
+        self.timed_out = False
+        self.cpu_time = 0.0  # user + sys time in seconds
+        self.wall_time = 0.0  # in seconds
+        self.max_rss = 0  # peak resident set size in bytes, 0 if unknown
+        self.oom_killed = False  # killed by the memory limit of the cgroup
+        self.spool = None  # temporary file holding stdout, see `execute`
+        self.aborted = False  # killed since the sink of stdout refused more
+        self.reaped = False
+        self.lock = threading.Lock()
+        self.cgroup = None
+
+
+def _to_text(data):
+    # the same newline translation as `subprocess.run(text=True)`
+    return data.decode(errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _user_tasks():
+    # number of threads of all the processes of the user, which is what
+    # RLIMIT_NPROC counts
+    uid, count = os.getuid(), 0
+    try:
+        pids = [pid for pid in os.listdir("/proc") if pid.isdigit()]
+    except OSError:
+        return 0
+    for pid in pids:
+        try:
+            if os.stat(f"/proc/{pid}").st_uid == uid:
+                count += len(os.listdir(f"/proc/{pid}/task"))
+        except OSError:
+            pass
+    return count
+
+
+def _set_rlimits(limits, procs_fd=None):
+    # runs in the forked child of a threaded process, hence only syscalls
+    # which take no lock: everything is prepared by the parent
+    for res, value in limits:
+        resource.setrlimit(res, value)
+    if procs_fd is not None:
+        try:
+            os.write(procs_fd, b"0")
+        except OSError:
+            pass
+
+
+def _pump_input(stream, data):
+    try:
+        stream.write(data)
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            stream.close()
+        except BrokenPipeError:
+            pass
+
+
+def _drain(stream, chunks):
+    for chunk in iter(lambda: stream.read1(1 << 16), b""):
+        chunks.append(chunk)
+
+
+def execute(
+    exec_p,
+    unit_case,
+    timeout,
+    memory=None,
+    wall_timeout=None,
+    spool=False,
+    sink=None,
+    processes=None,
+    file_size=None,
+):
+    """Run the executable `exec_p` with `unit_case` as its stdin.
+
+    The child is measured with wait4(2), so `cpu_time` and `max_rss` of the
+    returned Execution only account for the child itself, not for the
+    overhead of spawning it or the load of the machine. As CPU time is what
+    counts, the child is limited to `timeout` seconds of CPU time by rlimit
+    and is only killed by wall-clock once `wall_timeout` (`2 * timeout + 1` by
+    default) seconds have passed, e.g. when it blocks. `memory` in bytes, if
+    given, limits its address space. Linux accounts the image of the spawning
+    process to the child until it execs, so its peak RSS is only known when
+    above the peak of this process, `max_rss` being 0 otherwise, unless the
+    cgroup measures it.
+
+    The child runs in a session and thus a process group of its own, which
+    is killed as a whole when the child exits or is killed, so that forked
+    descendants can neither outlive it nor steal CPU from later testcases.
+    `processes`, if given, is the number of processes it may create, and
+    `file_size` in bytes limits the files it writes, including the spool.
+    Where a cgroup v2 can be created, the child runs in one of its own, see
+    `Cgroup`, and `cpu_time` includes that of all its descendants.
+
+    If `unit_case` is a Path, the file is passed to the child as its stdin
+    directly. With `spool`, stdout is written to an anonymous temporary file
+    which is returned as `Execution.spool` instead of `Execution.stdout`.
+    Neither way does the data pass through this process. With `sink`, stdout
+    is handed to `sink(chunk)` as it is produced instead of being collected,
+    and the child is killed as soon as the sink returns False.
+    """
+    if wall_timeout is None:
+        wall_timeout = 2 * timeout + 1
+    ps = Execution()
+    stdin = subprocess.PIPE
+    if isinstance(unit_case, Path):
+        stdin = open(unit_case, "rb")
+    stdout = subprocess.PIPE
+    if spool:
+        stdout = ps.spool = tempfile.TemporaryFile(prefix="shared_test-")
+    preexec_fn = procs_fd = None
+    try:
+        if hasattr(os, "wait4"):
+            # SIGXCPU at the soft limit, SIGKILL at the hard one if it is ignored
+            cpu_limit = max(1, math.ceil(timeout))
+            limits = [(resource.RLIMIT_CPU, (cpu_limit, cpu_limit + 1))]
+            if memory is not None:
+                limits.append((resource.RLIMIT_AS, memory))
+            if file_size is not None:
+                limits.append((resource.RLIMIT_FSIZE, file_size))
+            pids = None if processes is None else processes + 1
+            ps.cgroup = Cgroup.create(memory, pids)
+            if pids is not None and not (ps.cgroup and ps.cgroup.limits_pids):
+                # RLIMIT_NPROC counts all the threads of the user, so those
+                # running already are allowed on top, and the threads started
+                # below to serve the child: stderr, the timer, stdin and stdout
+                helpers = 2 + (stdin is subprocess.PIPE) + (stdout is subprocess.PIPE)
+                limits.append((resource.RLIMIT_NPROC, _user_tasks() + helpers + pids))
+            limits = [(r, v if isinstance(v, tuple) else (v, v)) for r, v in limits]
+            if ps.cgroup is not None:
+                procs_fd = ps.cgroup.open_procs()
+            preexec_fn = functools.partial(_set_rlimits, limits, procs_fd)
+        start_time = time.perf_counter()
+        proc = subprocess.Popen(
+            f"{exec_p.absolute()}",
+            stdin=stdin,
+            stdout=stdout,
+            stderr=subprocess.PIPE,
+            preexec_fn=preexec_fn,
+            start_new_session=True,
+        )
+    except BaseException:
+        if ps.cgroup is not None:
+            ps.cgroup.remove()
+        raise
+    finally:
+        if stdin is not subprocess.PIPE:
+            stdin.close()
+        if procs_fd is not None:
+            os.close(procs_fd)
+    # what the child inherited until it exec'd, see above
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+    _profile("spawn", start_time)
+    run_start = time.perf_counter()
+    if not hasattr(os, "wait4"):
+        try:
+            out, err = proc.communicate(
+                None if proc.stdin is None else unit_case.encode(),
+                timeout=wall_timeout,
+            )
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            out, err = proc.communicate()
+            ps.timed_out = True
+        ps.wall_time = ps.cpu_time = time.perf_counter() - start_time
+        ps.returncode = proc.returncode
+        ps.stdout = _to_text(out or b"")
+        ps.stderr = _to_text(err)
+    else:
+        out, err = list(), list()
+        threads = [threading.Thread(target=_drain, args=(proc.stderr, err))]
+        if proc.stdin is not None:
+            data = unit_case.encode()
+            threads.append(
+                threading.Thread(target=_pump_input, args=(proc.stdin, data))
+            )
+        if proc.stdout is not None and sink is not None:
+            threads.append(
+                threading.Thread(target=_feed, args=(proc, proc.stdout, sink, ps))
+            )
+        elif proc.stdout is not None:
+            threads.append(threading.Thread(target=_drain, args=(proc.stdout, out)))
+        timer = threading.Timer(wall_timeout, _kill_timed_out, args=(proc, ps))
+        try:
+            for t in threads:
+                t.start()
+            timer.start()
+            if hasattr(os, "waitid"):
+                # wait without reaping, so that a racing kill never hits a
+                # reused pid
+                os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+            with ps.lock:
+                if hasattr(os, "waitid"):
+                    _kill_group(proc, ps)
+                _, wait_status, rusage = os.wait4(proc.pid, 0)
+                ps.reaped = True
+        except BaseException:
+            # e.g. KeyboardInterrupt, the child must not outlive the test
+            timer.cancel()
+            with ps.lock:
+                if not ps.reaped:
+                    _kill_group(proc, ps)
+                    os.waitpid(proc.pid, 0)
+                    ps.reaped = True
+            if ps.cgroup is not None:
+                ps.cgroup.remove()
+            raise
+        _profile("run", run_start)
+        ps.wall_time = time.perf_counter() - start_time
+        timer.cancel()
+        timer.join()
+        proc.returncode = ps.returncode = os.waitstatus_to_exitcode(wait_status)
+        for t in threads:
+            t.join()
+        for stream in (proc.stdout, proc.stderr):
+            if stream is not None:
+                stream.close()
+        ps.cpu_time = rusage.ru_utime + rusage.ru_stime
+        if rusage.ru_maxrss > baseline:
+            ps.max_rss = rusage.ru_maxrss * 1024
+        if ps.cgroup is not None:
+            ps.cpu_time = max(ps.cpu_time, ps.cgroup.cpu_time())
+            ps.max_rss = max(ps.max_rss, ps.cgroup.memory_peak())
+            ps.oom_killed = ps.cgroup.oom_killed()
+            ps.cgroup.remove()
+        if ps.returncode == -signal.SIGXCPU:
+            ps.timed_out = True
+        ps.stdout = _to_text(b"".join(out))
+        ps.stderr = _to_text(b"".join(err))
+    if ps.spool is not None:
+        ps.spool.seek(0)
+    return ps
+
+
+def _out_of_memory(ps, memory):
+    """Whether the Execution `ps` failed for exceeding `memory` bytes
+
+    That is, killed by the cgroup, known to have used more, or failed to
+    allocate under the limit of its address space.
+    """
+    if memory is None:
+        return False
+    if ps.oom_killed or ps.max_rss > memory:
+        return True
+    messages = ("bad_alloc", "Cannot allocate memory")
+    return ps.returncode != 0 and any(m in ps.stderr for m in messages)
+
+
+_WHITESPACE = b" \t\n\r\x0b\x0c"
+
+
+class OutputNormalizer:
+    """Incrementally normalize an output before it is compared
+
+    Modes, from the strictest:
+        "exact": outputs must be identical
+        "strip": leading and trailing whitespace of the whole output is
+            ignored, which is the default
+        "lines": trailing whitespace of every line and trailing blank lines
+            are ignored
+        "tokens": outputs only need to have the same whitespace separated
+            tokens
+    Newlines are translated as `subprocess.run(text=True)` does in any mode.
+    The concatenation of what `feed` and `close` return is the normalized
+    output.
+    """
+
+    MODES = ("exact", "strip", "lines", "tokens")
+    _LINE_END = re.compile(rb"[ \t]+\n")
+    _SPACES = re.compile(rb"[ \t\n\r\x0b\x0c]+")
+
+    def __init__(self, mode="strip"):
+        if mode not in self.MODES:
+            raise ValueError(f"unknown comparison mode {mode}")
+        self.mode = mode
+        self.started = False
+        self.held = b""  # whitespace which is dropped if nothing follows
+        self.carry = b""  # a trailing "\r" which may start a "\r\n"
+
+    def feed(self, chunk):
+        chunk = self.carry + chunk
+        self.carry = b""
+        if chunk.endswith(b"\r"):
+            chunk, self.carry = chunk[:-1], b"\r"
+        chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        if self.mode == "exact":
+            return chunk
+        data = self.held + chunk
+        if not self.started and self.mode != "lines":
+            data = data.lstrip(_WHITESPACE)
+        body = data.rstrip(_WHITESPACE)
+        self.held = data[len(body) :]
+        if not body:
+            return b""
+        self.started = True
+        if self.mode == "lines":
+            return self._LINE_END.sub(b"\n", body)
+        if self.mode == "tokens":
+            return self._SPACES.sub(b" ", body)
+        return body
+
+    def close(self):
+        if self.mode == "exact":
+            return b"\n" if self.carry else b""
+        return b""
+
+
+class StreamComparator:
+    """Compare an output with the expected one while it is being produced
+
+    `expected` is a binary file-like object, which may be a pipe (e.g. the
+    stdout of a reference executable), read as far as needed. `feed` returns
+    False on the first difference or once the output exceeds `limit` bytes,
+    after which the output is rejected and `mismatch` holds the offset and
+    the line (1-based) of the first difference in the normalized output.
+    """
+
+    PREVIEW = 4096
+
+    def __init__(self, expected, mode="strip", limit=None):
+        self.expected = expected
+        self.expected_norm = OutputNormalizer(mode)
+        self.actual_norm = OutputNormalizer(mode)
+        self.limit = limit
+        self.exp_buf = b""
+        self.exp_eof = False
+        self.offset = 0  # bytes of normalized output matched so far
+        self.line = 1
+        self.size = 0  # bytes of raw output fed so far
+        self.exp_size = 0  # bytes of raw expected output read so far
+        self.head = bytearray()  # preview of the raw output
+        self.exp_head = bytearray()  # preview of the raw expected output
+        self.mismatch = None
+
+    def _pull(self):
+        # normalized expected output, False at the end
+        while not self.exp_buf:
+            if self.exp_eof:
+                return False
+            chunk = self._read_expected()
+            if chunk:
+                self.exp_buf = self.expected_norm.feed(chunk)
+            else:
+                self.exp_eof = True
+                self.exp_buf = self.expected_norm.close()
+        return True
+
+    def _read_expected(self):
+        chunk = self.expected.read(1 << 16)
+        self.exp_size += len(chunk)
+        if len(self.exp_head) <= self.PREVIEW:
+            self.exp_head += chunk[: self.PREVIEW + 1]
+        return chunk
+
+    def _match(self, data):
+        while data:
+            if not self._pull():
+                return self._differ(0)
+            n = min(len(data), len(self.exp_buf))
+            if data[:n] != self.exp_buf[:n]:
+                i = next(i for i in range(n) if data[i] != self.exp_buf[i])
+                self.line += data[:i].count(b"\n")
+                return self._differ(i)
+            self.line += data[:n].count(b"\n")
+            self.offset += n
+            data = data[n:]
+            self.exp_buf = self.exp_buf[n:]
+        return True
+
+    def _differ(self, i):
+        line = None if self.actual_norm.mode == "tokens" else self.line
+        self.mismatch = (self.offset + i, line)
+        return False
+
+    def feed(self, chunk):
+        if self.mismatch is not None:
+            return False
+        self.size += len(chunk)
+        if len(self.head) <= self.PREVIEW:
+            self.head += chunk[: self.PREVIEW + 1]
+        if self.limit is not None and self.size > self.limit:
+            return self._differ(0)
+        return self._match(self.actual_norm.feed(chunk))
+
+    def finish(self):
+        """Whether the whole output, all fed already, matches the expected"""
+        if self.mismatch is not None:
+            return False
+        if not self._match(self.actual_norm.close()):
+            return False
+        if self._pull():
+            return self._differ(0)
+        return True
+
+    def report(self, report):
+        """Add what to show for a rejected output to `report`"""
+
+        def preview(data):
+            txt = _to_text(bytes(data[: self.PREVIEW]))
+            return txt + "\n..." if len(data) > self.PREVIEW else txt
+
+        while not self.exp_eof and len(self.exp_head) <= self.PREVIEW:
+            self.exp_eof = not self._read_expected()
+        report.update(
+            result=preview(self.head),
+            expected=preview(self.exp_head),
+            mismatch=self.mismatch,
+        )
+
+
+def _open_binary(content):
+    if isinstance(content, Path):
+        return open(content, "rb")
+    return io.BytesIO(content.encode())
+
+
+def _feed(proc, stream, sink, ps):
+    for chunk in iter(lambda: stream.read1(1 << 16), b""):
+        if not ps.aborted and not sink(chunk):
+            ps.aborted = True
+            _kill(proc, ps)
+
+
+def _kill_timed_out(proc, ps):
+    ps.timed_out = True
+    _kill(proc, ps)
+
+
+def _kill(proc, ps):
+    # Popen.kill() would poll and thus might reap the child before wait4, so
+    # the signal is sent directly unless the child has been reaped already.
+    # The whole process group is killed, as is the cgroup if any, so that no
+    # forked descendant survives.
+    with ps.lock:
+        if not ps.reaped:
+            _kill_group(proc, ps)
+
+
+def _kill_group(proc, ps):
+    # must be called before the child is reaped, while its pid still names
+    # its process group
+    if ps.cgroup is not None:
+        ps.cgroup.kill()
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class ReferenceTimeout(Exception):
+    """Raised when the reference executable of a matching test times out"""
+
+
+class ReferenceRun:
+    """Run of the reference executable of a matching test
+
+    It is handed to `Test.run_case` as the verifier and started right before
+    EXEC on the same input, so that both run at the same time. Its stdout can
+    be `read` while being produced, so that both outputs are streamed into
+    the comparison. `result` waits for the reference and returns its stdout,
+    as is, since some comparisons look at whitespace.
+    """
+
+    def __init__(self, exec_p, exec_digest, timeout, name, cache=None, key=None):
+        self.exec_p = exec_p
+        self.exec_digest = exec_digest
+        self.timeout = timeout
+        self.name = name
+        self.cache = cache
+        self.key = key
+        self.output = None
+        self.returncode = None
+        self.thread = None
+        self.chunks = queue.Queue()
+        self.collected = list()
+        self.eof = False
+
+    def start(self, unit_case):
+        self.thread = threading.Thread(target=self._run, args=(unit_case,))
+        self.thread.start()
+
+    def _push(self, chunk):
+        self.collected.append(chunk)
+        self.chunks.put(chunk)
+        return True
+
+    def _run(self, unit_case):
+        try:
+            ps = execute(
+                self.exec_p,
+                unit_case,
+                self.timeout,
+                wall_timeout=self.timeout,
+                sink=self._push,
+            )
+        finally:
+            self.chunks.put(None)
+        if ps.timed_out:
+            return
+        self.returncode = ps.returncode
+        self.output = _to_text(b"".join(self.collected))
+        if self.cache is not None and ps.returncode == 0:
+            self.cache.put(self.key, self.output)
+
+    def read(self, size=-1):
+        """Read the stdout of the reference as it is produced, b"" at the end"""
+        if self.eof:
+            return b""
+        chunk = self.chunks.get()
+        if chunk is None:
+            self.eof = True
+            return b""
+        return chunk
+
+    def result(self):
+        self.thread.join()  # type: ignore
+        if self.output is None:
+            raise ReferenceTimeout(self.name)
+        return self.output
+
+
 class PseudoLabelTestset(TestSet):
     """Testset with pseudo labels generated from a given executable"""
 
-    def __init__(self, src_set: TestSet, labID, probID, sID):
+    def __init__(self, src_set: TestSet, labID, probID, sID, cache=None, timeout=7):
         super().__init__(src_set.name, src_set.labID, src_set.problemID)
         self.src_set = src_set
         self.cnt = 0
@@ -284,6 +2172,10 @@ class PseudoLabelTestset(TestSet):
         self.probID = probID
         self.src_it = iter(self.src_set)
         self.sID = sID
+        self.exec_p = Path(__file__).parent / self.labID / str(self.sID) / self.probID
+        self.cache = cache
+        self.timeout = timeout
+        self.exec_digest = file_digest(self.exec_p)
 
     def __len__(self):
         return self.num
@@ -296,30 +2188,231 @@ class PseudoLabelTestset(TestSet):
             _THEME.notify.warn(
                 f"The output of testcase {casename} in testset {self.src_set.name} may be not unique."
             )
-        exec_p = Path(__file__).parent / self.labID / str(self.sID) / self.probID
-        try:
-            complete_ps = subprocess.run(
-                f"{exec_p.absolute()}",
-                text=True,
-                capture_output=True,
-                timeout=7,
-                input=unit_case,
-            )
-        except subprocess.TimeoutExpired:
-            _THEME.notify.error(
-                f"{self.sID} timeout at testcase {casename} in testset {self.src_set.name} "
-            )
-            exit(1)
-        verifier = complete_ps.stdout.strip()
         self.cnt += 1
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(self.exec_digest, unit_case)
+            verifier = self.cache.get(key)
+            if verifier is not None:
+                return (casename, unit_case, verifier)
+        name = (
+            f"{self.sID} timeout at testcase {casename} in testset {self.src_set.name}"
+        )
+        verifier = ReferenceRun(
+            self.exec_p, self.exec_digest, self.timeout, name, self.cache, key
+        )
         return (casename, unit_case, verifier)
 
 
+def _generated(testset):
+    # whether the testcases of `testset` come from a generator
+    while hasattr(testset, "src_set"):
+        testset = testset.src_set
+    return isinstance(testset, RandomTestSetBase)
+
+
+def _reference_output(reference, unit_case):
+    # runs a ReferenceRun on its own, without EXEC alongside
+    reference.start(unit_case)
+    return reference.result()
+
+
+class _Deferred:
+    """Stand-in for a future which runs the call when its result is requested"""
+
+    def __init__(self, fn, *args):
+        self.fn = fn
+        self.args = args
+        self.done = False
+        self.value = None
+
+    def result(self):
+        if not self.done:
+            self.value = self.fn(*self.args)
+            self.done = True
+        return self.value
+
+
+class _BatchSlot:
+    """Future of a single testcase which is run within a batch"""
+
+    def __init__(self, index):
+        self.index = index
+        self.future = None  # future of the whole batch, set once submitted
+
+    def result(self):
+        return self.future.result()[self.index]  # type: ignore
+
+
+class _Scheduled:
+    """Future of a single testcase which is submitted by `_LongestFirst`"""
+
+    def __init__(self, scheduler, digest, unit_case):
+        self.scheduler = scheduler
+        self.digest = digest
+        if isinstance(unit_case, Path):
+            self.size = unit_case.stat().st_size
+        else:
+            self.size = len(unit_case)
+        self.future = None  # set once submitted
+
+    def result(self):
+        if self.future is None:
+            self.scheduler.start(self)
+        return self.future.result()  # type: ignore
+
+
+class _LongestFirst:
+    """Submits the testcases added to it longest first, `slots` at a time
+
+    The duration of a case is the mean of its recorded durations, see
+    `ResultsDB.durations`, or estimated from the size of its input at the
+    rate, in seconds per byte, of the cases added so far whose duration is
+    known. Whenever one finishes, the longest of the cases waiting starts,
+    so that the long cases do not finish last on a single worker while the
+    others are idle. A case which is waited for starts right away.
+    """
+
+    def __init__(self, submit, slots, history):
+        self.submit = submit
+        self.slots = slots
+        self.history = history
+        self.seconds = self.bytes = 0
+        self.heap = []  # (-cost, seq, slot, case)
+        self.seq = itertools.count()
+        self.running = 0
+        # reentrant, as a callback added to a finished future runs at once
+        self.lock = threading.RLock()
+
+    def add(self, slot, case):
+        duration = self.history.get(slot.digest)
+        if duration is None:
+            size = self.bytes
+            rate = self.seconds / size if self.seconds > 0 and size > 0 else 1e-8
+            duration = slot.size * rate
+        else:
+            self.seconds += duration
+            self.bytes += slot.size
+        with self.lock:
+            heapq.heappush(self.heap, (-duration, next(self.seq), slot, case))
+            self._fill()
+
+    def start(self, slot):
+        with self.lock:
+            if slot.future is not None:
+                return
+            for i, entry in enumerate(self.heap):
+                if entry[2] is slot:
+                    self.heap[i] = self.heap[-1]
+                    self.heap.pop()
+                    heapq.heapify(self.heap)
+                    self._start(slot, entry[3])
+                    return
+
+    def _fill(self):
+        while self.heap and self.running < self.slots:
+            _, _, slot, case = heapq.heappop(self.heap)
+            self._start(slot, case)
+
+    def _start(self, slot, case):
+        self.running += 1
+        slot.future = self.submit(*case)
+        slot.future.add_done_callback(self._done)
+
+    def _done(self, future):
+        with self.lock:
+            self.running -= 1
+            self._fill()
+
+
+def _shrink_size(txt):
+    tokens = txt.split()
+    magnitude = sum(abs(int(t)) for t in tokens if t.lstrip("-").isdigit())
+    return (len(tokens), len(txt), magnitude)
+
+
+def _generic_shrinks(txt):
+    lines = txt.split("\n")
+    size = len(lines) // 2
+    while size >= 1:
+        for start in range(0, len(lines), size):
+            yield "\n".join(lines[:start] + lines[start + size :])
+        size //= 2
+    for i, line in enumerate(lines):
+        tokens = line.split()
+        for j, tok in enumerate(tokens):
+            replacements = [""]
+            if tok.lstrip("-").isdigit() and abs(int(tok)) > 1:
+                replacements += ["0", "1", str(int(tok) // 2)]
+            for rep in replacements:
+                new_line = " ".join(
+                    tokens[:j] + ([rep] if rep else []) + tokens[j + 1 :]
+                )
+                yield "\n".join(lines[:i] + [new_line] + lines[i + 1 :])
+
+
+def shrink_input(txt, fails, shrink=None, max_tries=5000):
+    """Greedily shrink the input `txt` while `fails(input)` holds
+
+    Candidates come from `shrink(input)`, a hook which a spec may provide as a
+    module-level function yielding smaller inputs, followed by generic ones
+    deleting lines and tokens and reducing integers.
+    """
+    tries = 0
+    improved = True
+    while improved and tries < max_tries:
+        improved = False
+        candidates = _generic_shrinks(txt)
+        if shrink is not None:
+            candidates = itertools.chain(shrink(txt), candidates)
+        for candidate in candidates:
+            if _shrink_size(candidate) >= _shrink_size(txt):
+                continue
+            tries += 1
+            if fails(candidate):
+                txt = candidate
+                improved = True
+                break
+            if tries >= max_tries:
+                break
+    return txt
+
+
 class Status(Enum):
     SUCCESS = 0
     WRONG_ANSWER = 1
     TIME_LIMIT_EXCESS = 2
     RUNTIME_ERROR = 3
+    MEMORY_LIMIT_EXCEEDED = 4
+
+
+_SPEC_MODULES = dict()
+
+
+def load_spec(spec_p):
+    """Import the `spec.py` at `spec_p` under a module name of its own
+
+    The name is derived from the lab and the problem, so that the specs of
+    several problems can be loaded in one process without touching sys.path.
+    Every spec is executed once per process and its bytecode is cached in
+    `__pycache__` like that of any other module.
+    """
+    spec_p = Path(spec_p).resolve()
+    module = _SPEC_MODULES.get(spec_p)
+    if module is not None:
+        return module
+    prob_p = spec_p.parent
+    name = "spec_" + re.sub(r"\W", "_", f"{prob_p.parent.parent.name}_{prob_p.name}")
+    module_spec = importlib.util.spec_from_file_location(name, spec_p)
+    module = importlib.util.module_from_spec(module_spec)  # type: ignore
+    sys.modules[name] = module
+    try:
+        module_spec.loader.exec_module(module)  # type: ignore
+    except BaseException:
+        del sys.modules[name]
+        raise
+    _SPEC_MODULES[spec_p] = module
+    return module
 
 
 class Test:
@@ -331,6 +2424,10 @@ class Test:
             self.theme = DefaultTheme()
         self.labID = args.LABID
         self.problemID = args.PROBID
+        self.spec_p = None
+        self.results = None
+        self.corpus = None
+        self.ref_cache = None
 
     def import_spec(self, args):
         notify = self.theme.notify
@@ -340,7 +2437,11 @@ class Test:
                 f"{str(test_basedir)} not a directory. It is possible that nobody has written a testcase yet "
             )
             sys.exit(1)
-        spec_p = test_basedir / "spec.py"
+        native_spec_p = test_basedir / "spec.out"
+        if native_spec_p.is_file() and os.access(native_spec_p, os.X_OK):
+            self.spec_p = native_spec_p
+            return NativeSpec(native_spec_p.absolute())
+        spec_p = self.spec_p = test_basedir / "spec.py"
         if not spec_p.is_file():
             notify.warn("spec.py not found.")
             if notify.yes_or_no(
@@ -352,9 +2453,8 @@ class Test:
                 )
             else:
                 sys.exit(1)
-        sys.path.insert(1, str(test_basedir))
         try:
-            return importlib.import_module("spec")
+            return load_spec(spec_p)
         except Exception:
             notify.error(f"spec.* not found under {str(test_basedir)}")
             sys.exit(1)
@@ -362,7 +2462,7 @@ class Test:
     def get_testsets(self, args, spec):
         testset_opt = list()
         case_num = 5
-        if not args.random and not args.Random:
+        if not args.random and not args.Random and not args.replay:
             testset_opt = ["default"]
         elif args.Random:
             testset_opt = ["default", "random"]
@@ -373,8 +2473,38 @@ class Test:
         testsets = list()
         if "default" in testset_opt:
             testsets.append(DefaultTestSet(self.labID, self.problemID, spec))
+        if args.replay:
+            tag = None if args.replay == "all" else args.replay
+            corpus_set = CorpusTestSet(self.labID, self.problemID, spec, tag)
+            if len(corpus_set) == 0:
+                what = "testcase" if tag is None else f"{tag} testcase"
+                txt = f"no {what} stored in the corpus of {self.problemID}"
+                if not testset_opt:
+                    self.theme.notify.error(txt)
+                    sys.exit(1)
+                self.theme.notify.warn(txt)
+            testsets.append(corpus_set)
         if "random" in testset_opt:
-            testsets.append(spec.RandomTestSet(self.labID, self.problemID, case_num))
+            random_set = spec.RandomTestSet(self.labID, self.problemID, case_num)
+            random_set.seed = args.seed
+            if random_set.seed is None:
+                random_set.seed = random.getrandbits(63)
+            print(f"Random testcases with seed {random_set.seed}")
+            if args.case is not None:
+                if not 1 <= args.case <= case_num:
+                    self.theme.notify.error(f"--case must be within 1..{case_num}")
+                    sys.exit(1)
+                # only the NUM-th case, as numbered by `cnt`
+                random_set.select(args.case - 1, 1)
+            if (
+                args.gen_workers
+                and not isinstance(random_set, NativeRandomTestSet)
+                and "fork" in multiprocessing.get_all_start_methods()
+            ):
+                random_set = PrefetchTestSet(
+                    random_set, args.gen_workers, args.prefetch
+                )
+            testsets.append(random_set)
         return testsets
 
     def get_exec_path(self, args):
@@ -386,61 +2516,469 @@ class Test:
         return exec_p
 
     def match_test(self, args, testsets, config, exec_p):
+        cache = self.ref_cache
+        if cache is None and args.cache_size > 0:
+            cache = RefOutputCache(_CACHE_DIR / "reference", args.cache_size << 20)
+        ref_timeout = config.get("ref_timeout", 7)
         pseudo_testsets = list()
         for tss in testsets:
             pseudo_testsets.append(
-                PseudoLabelTestset(tss, args.LABID, args.PROBID, args.match)
+                PseudoLabelTestset(
+                    tss, args.LABID, args.PROBID, args.match, cache, ref_timeout
+                )
             )
         self.unit_test(args, pseudo_testsets, config, exec_p)
 
-    def unit_test(self, args, testsets, config, exec_p):
+    def stress_test(self, args, spec, config, exec_p):
+        """Match EXEC with another executable on random testcases until they
+        disagree, then shrink the input of the disagreement"""
+        notify = self.theme.notify
+        if not args.match or not hasattr(spec, "RandomTestSet"):
+            notify.error("--stress requires -m SID and a RandomTestSet in the spec")
+            sys.exit(1)
+        ref_p = Path(__file__).parent / self.labID / str(args.match) / self.problemID
+        ref_digest = file_digest(ref_p)
+        ref_timeout = config.get("ref_timeout", 7)
+        random_set = spec.RandomTestSet(self.labID, self.problemID, 0)
+        random_set.seed = args.seed
+        if random_set.seed is None:
+            random_set.seed = random.getrandbits(32)
+        random_set.num = args.random or args.Random or sys.maxsize
+        cases = random_set
+        if args.gen_workers and not isinstance(random_set, NativeRandomTestSet):
+            cases = PrefetchTestSet(random_set, args.gen_workers, args.prefetch)
+
+        def check(unit_case, ref_timeout=ref_timeout):
+            reference = ReferenceRun(ref_p, ref_digest, ref_timeout, ref_p.name)
+            status, _, report = self.run_case(exec_p, unit_case, reference, config)
+            return status, report, reference
+
+        jobs = _jobs(args.jobs)
+        print(f"Stress testing with seed {random_set.seed}")
+        start_time = time.perf_counter()
+        last_print = start_time
+        tested = 0
+        found = None
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            in_flight = dict()
+            case_it = enumerate(cases)
+            while found is None:
+                for index, (casename, unit_case, _) in case_it:
+                    future = pool.submit(check, unit_case)
+                    in_flight[future] = (index, casename, unit_case)
+                    if len(in_flight) >= 2 * jobs:
+                        break
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in sorted(done, key=lambda f: in_flight[f][0]):
+                    case = in_flight.pop(future)
+                    tested += 1
+                    try:
+                        status = future.result()[0]
+                    except ReferenceTimeout:
+                        notify.error(f"{args.match} timeout at testcase {case[1]}")
+                        sys.exit(1)
+                    if status != Status.SUCCESS and found is None:
+                        found = case + (status,)
+                now = time.perf_counter()
+                if now - last_print > 1:
+                    last_print = now
+                    rate = tested / (now - start_time)
+                    print(f"\r{tested} cases, {rate:.1f} cases/s", end="", flush=True)
+            for future in in_flight:
+                future.cancel()
+        elapsed = time.perf_counter() - start_time
+        print(f"\r{tested} cases in {elapsed:.2f}s, {tested / elapsed:.1f} cases/s")
+        if found is None:
+            print("No counterexample found")
+            return
+        index, casename, unit_case, status = found
+        if isinstance(unit_case, Path):
+            unit_case = unit_case.read_text()
+        print(
+            f"{status.name} at testcase {casename}, "
+            f"rerun with -s {random_set.seed} -r {index + 1} --case {index + 1}"
+        )
+
+        # Shrunk inputs may well be invalid, on which the other executable is
+        # not required to behave, so it is given less time and has to succeed
+        # while EXEC has to fail the same way as it did.
+        shrink_timeout = min(ref_timeout, config["timeout"])
+
+        def fails(candidate):
+            try:
+                shrunk_status, _, reference = check(candidate, shrink_timeout)
+            except ReferenceTimeout:
+                return False
+            return shrunk_status == status and reference.returncode == 0
+
+        unit_case = shrink_input(unit_case, fails, getattr(spec, "shrink", None))
+        status, report, reference = check(unit_case)
+        print(f"Minimal counterexample ({status.name}):\n{unit_case}")
+        print(f"expected:\n{reference.output.strip()}")
+        if "result" in report:
+            print(f"current:\n{report['result']}")
+        if args.save_failing and reference.output is not None:
+            corpus = Corpus(self.labID, self.problemID)
+            corpus.add(casename, unit_case, reference.output, "failing")
+            corpus.close()
+
+    def run_case(self, exec_p, unit_case, verifier, config):
+        """Run EXEC on a single testcase.
+
+        Returns: (status, duration, report)
+            status (Status): verdict of the testcase
+            duration (float): CPU time spent by EXEC in seconds
+            report (dict): extra keyword arguments for `post_testcase`
+        """
         timeout = config["timeout"]
+        memory = config.get("memory")
+        if memory is not None:
+            memory = int(memory * (1 << 20))
+        if isinstance(verifier, ReferenceRun):
+            verifier.start(unit_case)
+        with contextlib.ExitStack() as stack:
+            comparator = None
+            if isinstance(verifier, ReferenceRun):
+                comparator = self.comparator(verifier, config)
+            elif isinstance(verifier, (str, Path)):
+                expected = stack.enter_context(_open_binary(verifier))
+                comparator = self.comparator(expected, config)
+            ps = execute(
+                exec_p,
+                unit_case,
+                timeout,
+                memory,
+                spool=comparator is None and isinstance(unit_case, Path),
+                sink=None if comparator is None else comparator.feed,
+                processes=config.get("processes"),
+                file_size=int(config.get("output_limit", 256) * (1 << 20)),
+            )
+            if isinstance(verifier, ReferenceRun):
+                verifier.result()
+            report = {"memory": ps.max_rss}
+            if ps.spool is not None:
+                stack.enter_context(ps.spool)
+            if ps.aborted:
+                comparator.report(report)  # type: ignore
+                return (Status.WRONG_ANSWER, ps.cpu_time, report)
+            if ps.timed_out or ps.cpu_time > timeout:
+                return (Status.TIME_LIMIT_EXCESS, timeout, report)
+            duration = ps.cpu_time
+            if _out_of_memory(ps, memory):
+                return (Status.MEMORY_LIMIT_EXCEEDED, duration, report)
+            if ps.returncode != 0:
+                return (Status.RUNTIME_ERROR, duration, dict(report, stderr=ps.stderr))
+            verify_start = time.perf_counter()
+            if comparator is not None:
+                accepted = comparator.finish()
+                if not accepted:
+                    comparator.report(report)
+            else:
+                output = ps.stdout if ps.spool is None else ps.spool
+                accepted = self.verify(unit_case, output, verifier, report, config)
+            _profile("verify", verify_start)
+        if not accepted:
+            return (Status.WRONG_ANSWER, duration, report)
+        return (Status.SUCCESS, duration, report)
+
+    def run_batch(self, exec_p, cases, config):
+        """Run EXEC once on the concatenated inputs of many testcases
+
+        `cases` is a list of (unit_case, verifier). The output is split into
+        the outputs of the cases according to the "batch" config, see the
+        epilog, and every case is judged as if it were run alone, sharing the
+        CPU time evenly.
+
+        Returns: a list of (status, duration, report) for the cases
+        """
+        batch = config["batch"]
+        n = len(cases)
+        inputs = list()
+        for unit_case, _ in cases:
+            if isinstance(unit_case, Path):
+                unit_case = unit_case.read_text()
+            inputs.append(unit_case if unit_case.endswith("\n") else unit_case + "\n")
+        if batch.get("header") == "count":
+            inputs.insert(0, f"{n}\n")
+        batch_input = "".join(inputs)
+        if batch.get("header") == "count":
+            inputs.pop(0)
+        timeout = batch.get("timeout", config["timeout"] * n)
+        memory = config.get("memory")
+        if memory is not None:
+            memory = int(memory * (1 << 20))
+        reference = next((v for _, v in cases if isinstance(v, ReferenceRun)), None)
+        if reference is not None:
+            reference = ReferenceRun(
+                reference.exec_p,
+                reference.exec_digest,
+                reference.timeout * n,
+                reference.name,
+            )
+            reference.start(batch_input)
+        ps = execute(
+            exec_p, batch_input, timeout, memory, processes=config.get("processes")
+        )
+        expected_outputs = None
+        if reference is not None:
+            expected_outputs = self.split_batch_output(reference.result(), n, batch)
+            if reference.returncode == 0:
+                # cached per case, as if it had been run on the case alone
+                for (_, verifier), output in zip(cases, expected_outputs):
+                    if (
+                        isinstance(verifier, ReferenceRun)
+                        and verifier.cache is not None
+                    ):
+                        output = output + "\n" if output else ""
+                        verifier.cache.put(verifier.key, output)
+        report = {"memory": ps.max_rss}
+        duration = ps.cpu_time / n
+        status = None
+        if ps.timed_out or ps.cpu_time > timeout:
+            status, duration = Status.TIME_LIMIT_EXCESS, timeout / n
+        elif _out_of_memory(ps, memory):
+            status = Status.MEMORY_LIMIT_EXCEEDED
+        elif ps.returncode != 0:
+            status = Status.RUNTIME_ERROR
+            report["stderr"] = ps.stderr
+        if status is not None:
+            return [(status, duration, report)] * n
+        outputs = self.split_batch_output(ps.stdout, n, batch)
+        results = list()
+        for i, (unit_case, verifier) in enumerate(cases):
+            case_report = dict(report)
+            if expected_outputs is not None:
+                verifier = expected_outputs[i]
+            verify_start = time.perf_counter()
+            accepted = self.verify(inputs[i], outputs[i], verifier, case_report, config)
+            _profile("verify", verify_start)
+            status = Status.SUCCESS if accepted else Status.WRONG_ANSWER
+            results.append((status, duration, case_report))
+        return results
+
+    def split_batch_output(self, output, n, batch):
+        """Split the output of a batch into those of its `n` cases
+
+        Missing outputs are empty and anything extra is left to the last case
+        so that it is rejected.
+        """
+        lines = output.strip("\n").split("\n")
+        delimiter = batch.get("delimiter")
+        if delimiter is not None:
+            parts = [[]]
+            for line in lines:
+                if line.rstrip() == delimiter:
+                    parts.append([])
+                else:
+                    parts[-1].append(line)
+            if parts and not parts[-1]:
+                parts.pop()
+        else:
+            k = batch.get("lines", 1)
+            parts = [lines[i : i + k] for i in range(0, len(lines), k)]
+        outputs = ["\n".join(part) for part in parts[: n - 1]]
+        outputs.append("\n".join(sum(parts[n - 1 :], [])))
+        outputs += [""] * (n - len(outputs))
+        return outputs
+
+    def comparator(self, expected, config):
+        limit = config.get("output_limit", 256)
+        return StreamComparator(
+            expected, config.get("compare", "strip"), int(limit * (1 << 20))
+        )
+
+    def verify(self, unit_case, output, verifier, report, config):
+        """Whether `output`, either a string or a binary file, is accepted
+
+        Outputs are matched with a string or a Path by chunks. When rejected,
+        what to show is added to `report`.
+        """
+        if isinstance(verifier, (str, Path)):
+            with _open_binary(verifier) as expected_f:
+                comparator = self.comparator(expected_f, config)
+                if isinstance(output, str):
+                    accepted = comparator.feed(output.encode())
+                else:
+                    chunks = iter(lambda: output.read(1 << 16), b"")
+                    accepted = all(comparator.feed(chunk) for chunk in chunks)
+                if not (accepted and comparator.finish()):
+                    comparator.report(report)
+                    return False
+            return True
+        if isinstance(verifier, NativeChecker):
+            return verifier(unit_case, output)
+        if isinstance(unit_case, Path):
+            unit_case = unit_case.read_text()
+        if not isinstance(output, str):
+            output = _to_text(output.read())
+        if Profiler.current is not None:
+            return Profiler.current.spec_call(verifier, unit_case, output)
+        return verifier(unit_case, output)
+
+    def unit_test(self, args, testsets, config, exec_p):
         info = self.theme.testInfo
-        for testset in testsets:
-            info.pre_testset(testset.name)
-            for casename, unit_case, verifier in testset:
-                info.pre_testcase(casename, unit_case)
-                duration = -1.0
-                start_time = time.time()
-                status = Status.SUCCESS
-                try:
-                    complete_ps = subprocess.run(
-                        f"{exec_p.absolute()}",
-                        text=True,
-                        capture_output=True,
-                        timeout=timeout,
-                        input=unit_case,
+        self.exec_digest = file_digest(exec_p)
+        h = hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode())
+        if self.spec_p is not None:
+            h.update(file_digest(self.spec_p).encode())
+        self.config_digest = h.hexdigest()
+        self.results = ResultsDB(_CACHE_DIR / "results.sqlite3")
+        if args.save_cases or args.save_failing:
+            self.corpus = Corpus(self.labID, self.problemID)
+        jobs = getattr(args, "jobs", 1)
+        workers = getattr(args, "workers", 0)
+        listen = getattr(args, "listen", None)
+        try:
+            if workers or listen:
+                with RemotePool(listen, workers) as pool:
+                    if listen:
+                        print(f"Waiting for workers on {pool.address}")
+                    self._run_testsets(testsets, info, pool, 256, 64, exec_p, config)
+                return
+            if jobs is None or jobs == 1:
+                self._run_testsets(testsets, info, None, 0, 1, exec_p, config)
+                return
+            if jobs <= 0:
+                jobs = os.cpu_count() or 1
+            # a longer window lets the longest-first schedule look further ahead
+            longest = getattr(args, "schedule", "longest") == "longest"
+            window = (16 if longest else 4) * jobs
+            with ThreadPoolExecutor(max_workers=jobs) as pool:
+                self._run_testsets(testsets, info, pool, window, jobs, exec_p, config)
+        finally:
+            self.results.close()
+            self.results = None
+            if self.corpus is not None:
+                self.corpus.close()
+                self.corpus = None
+
+    def save_case(self, casename, unit_case, verifier, status):
+        """Store a generated testcase in the corpus as `--save-cases` and
+        `--save-failing` ask for"""
+        if isinstance(verifier, ReferenceRun):
+            # never started in batch mode, nothing to store then
+            verifier = verifier.output
+            if verifier is None:
+                return
+        elif not isinstance(verifier, (str, Path)):
+            verifier = None
+        if self.args.save_cases:
+            self.corpus.add(casename, unit_case, verifier, "generated")  # type: ignore
+        if self.args.save_failing and status != Status.SUCCESS:
+            self.corpus.add(casename, unit_case, verifier, "failing")  # type: ignore
+
+    def _iter_cases(self, testset):
+        # yields (casename, unit_case, verifier, digest)
+        if Profiler.current is not None:
+            testset = Profiler.current.iterate(testset)
+        cases = (case + (case_digest(case[1], case[2]),) for case in testset)
+        if not self.args.failed_first:
+            return cases
+
+        def passed_before(case):
+            status = self.results.last_status(case[3], self.config_digest)  # type: ignore
+            return status is None or status == Status.SUCCESS
+
+        return sorted(cases, key=passed_before)
+
+    def _run_testsets(self, testsets, info, pool, window, slots, exec_p, config):
+        # Cases of all testsets are submitted to `pool` while at most `window`
+        # of them are in flight, in order or longest first among those, and
+        # reported in the order of the testsets so that the output is the same
+        # as that of a sequential run.
+        pending = deque()
+        in_flight = 0
+        results = self.results
+
+        def drain(limit):
+            nonlocal in_flight
+            while pending and in_flight > limit:
+                entry = pending.popleft()
+                if entry[0] == "pre_testset":
+                    info.pre_testset(entry[1])
+                elif entry[0] == "post_testset":
+                    info.post_testset()
+                else:
+                    _, casename, unit_case, verifier, digest, future, keep = entry
+                    in_flight -= 1
+                    report_start = time.perf_counter()
+                    info.pre_testcase(casename, unit_case)
+                    # "report" goes on with post_testcase below, the wait for
+                    # the result in between is left out
+                    _profile("report", report_start, casename)
+                    if isinstance(future, tuple):
+                        status, duration = future
+                        report_start = time.perf_counter()
+                        info.post_testcase(status, duration, cached=True)
+                        _profile("report", report_start, casename, cont=True)
+                        continue
+                    try:
+                        status, duration, report = future.result()
+                    except ReferenceTimeout as e:
+                        self.theme.notify.error(str(e))
+                        sys.exit(1)
+                    results.put(  # type: ignore
+                        self.exec_digest, digest, self.config_digest, status, duration
                     )
-                    duration = time.time() - start_time
-                    testcase_infoed = False
-                    if isinstance(verifier, str):
-                        if complete_ps.stdout.strip() != verifier.strip():
-                            status = Status.WRONG_ANSWER
-                            testcase_infoed = True
-                            info.post_testcase(
-                                status,
-                                duration,
-                                result=complete_ps.stdout,
-                                expected=verifier,
-                            )
-                    else:
-                        if not verifier(unit_case, complete_ps.stdout):
-                            status = Status.WRONG_ANSWER
-                    if not testcase_infoed:
-                        info.post_testcase(status, duration)
-                except subprocess.TimeoutExpired:
-                    duration = timeout
-                    status = Status.TIME_LIMIT_EXCESS
-                    info.post_testcase(status, duration)
-                except subprocess.CalledProcessError:
-                    duration = time.time() - start_time
-                    status = Status.RUNTIME_ERROR
-                    info.post_testcase(
-                        status,
-                        duration,
-                        stderr=complete_ps.stderr,  # type: ignore
+                    if keep and self.corpus is not None:
+                        self.save_case(casename, unit_case, verifier, status)
+                    report_start = time.perf_counter()
+                    info.post_testcase(status, duration, **report)
+                    _profile("report", report_start, casename, cont=True)
+
+        def submit(fn, *args):
+            if pool is None:
+                return _Deferred(fn, *args)
+            return pool.submit(fn, *args)
+
+        # in batch mode, cases are collected into `group` and run together
+        batch = config.get("batch")
+        group = list()
+        # with the longest-first schedule, `slots` cases run at once, the
+        # longest of those in the window first
+        scheduler = None
+        if pool is not None and not batch and self.args.schedule == "longest":
+            history = results.durations(self.config_digest)  # type: ignore
+            run = functools.partial(submit, self.run_case)
+            scheduler = _LongestFirst(run, slots, history)
+
+        def flush_group():
+            if group:
+                cases = [(unit_case, verifier) for _, unit_case, verifier in group]
+                future = submit(self.run_batch, exec_p, cases, config)
+                for slot, _, _ in group:
+                    slot.future = future
+                group.clear()
+            drain(window)
+
+        for testset in testsets:
+            pending.append(("pre_testset", testset.name))
+            keep = _generated(testset)
+            for casename, unit_case, verifier, digest in self._iter_cases(testset):
+                future = None
+                if self.args.changed_only:
+                    future = results.get(  # type: ignore
+                        self.exec_digest, digest, self.config_digest
                     )
-            info.post_testset()
+                if future is None and batch:
+                    future = _BatchSlot(len(group))
+                    group.append((future, unit_case, verifier))
+                elif future is None and scheduler is not None:
+                    future = _Scheduled(scheduler, digest, unit_case)
+                    scheduler.add(future, (exec_p, unit_case, verifier, config))
+                elif future is None:
+                    future = submit(self.run_case, exec_p, unit_case, verifier, config)
+                pending.append(
+                    ("testcase", casename, unit_case, verifier, digest, future, keep)
+                )
+                in_flight += 1
+                if not batch or len(group) >= batch.get("size", 1000):
+                    flush_group()
+            flush_group()
+            pending.append(("post_testset",))
+        drain(-1)
         info.post_test()
 
     def test_main(self, args, testsets, config, exec_p):
@@ -454,24 +2992,928 @@ class Test:
         for tt in testType:
             tt(args, testsets, config, exec_p)
 
+    def grade(self, args, spec, config):
+        """Grade every submission of the problem on the same testcases
+
+        Every testcase is generated once and, when matching with `-m SID`,
+        the output of SID is computed once, before all the submissions are
+        run on all the cores, or `-j NUM` workers. A SID × testcase verdict
+        matrix is printed at the end.
+        """
+        notify = self.theme.notify
+        execs = find_submissions(self.labID, self.problemID)
+        if args.match:
+            execs = [e for e in execs if e.parent.name != str(args.match)]
+        if not execs:
+            notify.error(f"no submission of {self.labID} {self.problemID} found")
+            sys.exit(1)
+        testsets = self.get_testsets(args, spec)
+        if args.match:
+            cache = None
+            if args.cache_size > 0:
+                cache = RefOutputCache(_CACHE_DIR / "reference", args.cache_size << 20)
+            ref_timeout = config.get("ref_timeout", 7)
+            testsets = [
+                PseudoLabelTestset(
+                    ts, self.labID, self.problemID, args.match, cache, ref_timeout
+                )
+                for ts in testsets
+            ]
+        jobs = _jobs(args.jobs, 0)
+        batch = config.get("batch")
+        size = batch.get("size", 1000) if batch else 1
+        cases = list()
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            for ts in testsets:
+                for casename, unit_case, verifier in ts:
+                    if isinstance(verifier, ReferenceRun):
+                        verifier = pool.submit(_reference_output, verifier, unit_case)
+                    cases.append([ts.name, casename, unit_case, verifier])
+            for case in cases:
+                if isinstance(case[3], Future):
+                    try:
+                        case[3] = case[3].result()
+                    except ReferenceTimeout as e:
+                        notify.error(str(e))
+                        sys.exit(1)
+            print(f"Grading {len(execs)} submissions on {len(cases)} testcases")
+            runs = list()
+            for exec_p in execs:
+                for first in range(0, len(cases), size):
+                    chunk = [(c[2], c[3]) for c in cases[first : first + size]]
+                    if batch:
+                        future = pool.submit(self.run_batch, exec_p, chunk, config)
+                    else:
+                        future = pool.submit(self.run_case, exec_p, *chunk[0], config)
+                    runs.append(future)
+            verdicts = list()
+            for future in runs:
+                if batch:
+                    verdicts.extend(status for status, _, _ in future.result())
+                else:
+                    verdicts.append(future.result()[0])
+        self.print_matrix(execs, cases, verdicts)
+
+    _VERDICT_CHARS = {
+        Status.SUCCESS: ".",
+        Status.WRONG_ANSWER: "W",
+        Status.TIME_LIMIT_EXCESS: "T",
+        Status.RUNTIME_ERROR: "R",
+        Status.MEMORY_LIMIT_EXCEEDED: "M",
+    }
+
+    def print_matrix(self, execs, cases, verdicts):
+        # `verdicts` holds the statuses of all cases of every exec in turn
+        print(
+            "Verdicts (. passed, W wrong answer, T time limit exceeded,"
+            " R runtime error, M memory limit exceeded):"
+        )
+        width = max(len(e.parent.name) for e in execs) + 2
+        bounds = [i for i in range(1, len(cases)) if cases[i][0] != cases[i - 1][0]]
+        # the name of every testset, cut to the columns of its cases
+        columns = list()
+        for name, group in itertools.groupby(case[0] for case in cases):
+            n = len(list(group))
+            columns.append(name[:n].ljust(n))
+        print((" " * width + "|".join(columns)).rstrip())
+        for i, exec_p in enumerate(execs):
+            row = verdicts[i * len(cases) : (i + 1) * len(cases)]
+            cells = [self._VERDICT_CHARS[status] for status in row]
+            for b in reversed(bounds):
+                cells.insert(b, "|")
+            passed = row.count(Status.SUCCESS)
+            print(f"{exec_p.parent.name:<{width}}{''.join(cells)}  {passed}/{len(row)}")
+
     def perform(self):
         spec = self.import_spec(self.args)
         config = spec.get_config()
-        testsets = self.get_testsets(self.args, spec)
-        exec_p = self.get_exec_path(self.args)
+        if self.args.stress:
+            self.stress_test(self.args, spec, config, self.get_exec_path(self.args))
+            return
+        if self.args.grade:
+            self.grade(self.args, spec, config)
+            return
+        if self.args.profile or self.args.profile_spec or self.args.trace:
+            Profiler.current = Profiler(self.args.profile_spec)
+        try:
+            testsets = self.get_testsets(self.args, spec)
+            exec_p = self.get_exec_path(self.args)
+
+            self.test_main(self.args, testsets, config, exec_p)
+        finally:
+            profiler, Profiler.current = Profiler.current, None
+        if profiler is not None:
+            profiler.print_table()
+            if self.args.trace:
+                profiler.write_trace(self.args.trace)
+
+
+def _percentile(sorted_values, p):
+    # nearest-rank percentile
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def fit_exponent(sizes, times):
+    """Least squares fit of `times ~ c * sizes ** k`, returns k or None"""
+    points = [
+        (math.log(n), math.log(t)) for n, t in zip(sizes, times) if n > 0 and t > 0
+    ]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    var = sum((x - mean_x) ** 2 for x, _ in points)
+    if var == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var
+
+
+class Bench:
+    """Measure executables on random testcases of growing sizes
+
+    For every size, `cases` testcases are generated by the RandomTestSet of
+    the spec with `size` set, and every executable runs `warmup` times
+    unmeasured and then `repeat` times on each of them.
+    """
 
-        self.test_main(self.args, testsets, config, exec_p)
+    def __init__(self, args, theme=None):
+        self.args = args
+        self.test = Test(args, theme)
+        self.notify = self.test.theme.notify
+
+    def executables(self):
+        execs = [Path(e) for e in self.args.EXEC]
+        for sid in self.args.match or []:
+            execs.append(
+                Path(__file__).parent / self.args.LABID / sid / self.args.PROBID
+            )
+        for exec_p in execs:
+            if not exec_p.is_file():
+                self.notify.error(
+                    f"{exec_p.absolute()} is not a valid path to an executable"
+                )
+                sys.exit(1)
+        return execs
+
+    def measure(self, exec_p, cases, config):
+        args = self.args
+        times, rss, failures = list(), list(), 0
+        memory = config.get("memory")
+        if memory is not None:
+            memory = int(memory * (1 << 20))
+        for _, unit_case, verifier in cases:
+            for i in range(args.warmup + args.repeat):
+                # run to the end without early exits which would skew timing
+                ps = execute(
+                    exec_p,
+                    unit_case,
+                    config["timeout"],
+                    memory,
+                    processes=config.get("processes"),
+                )
+                if i < args.warmup:
+                    continue
+                if (
+                    ps.timed_out
+                    or ps.returncode != 0
+                    or not self.test.verify(unit_case, ps.stdout, verifier, {}, config)
+                ):
+                    failures += 1
+                times.append(ps.cpu_time)
+                rss.append(ps.max_rss)
+        times.sort()
+        return {
+            "median": _percentile(times, 50),
+            "p95": _percentile(times, 95),
+            "p99": _percentile(times, 99),
+            "max_rss": max(rss) or None,  # 0 means unknown, see `execute`
+            "failures": failures,
+        }
+
+    def perform(self):
+        args = self.args
+        spec = self.test.import_spec(args)
+        config = spec.get_config()
+        if not hasattr(spec, "RandomTestSet"):
+            self.notify.error("bench requires a RandomTestSet in the spec")
+            sys.exit(1)
+        execs = self.executables()
+        sizes = [int(size) for size in args.sizes.split(",")]
+        seed = random.getrandbits(32) if args.seed is None else args.seed
+        results = {str(e): {"sizes": dict()} for e in execs}
+        print(f"Benchmarking with seed {seed}")
+        header = f"{'size':>10} {'median':>10} {'p95':>10} {'p99':>10} {'peak RSS':>10}"
+        for size_idx, size in enumerate(sizes):
+            random_set = spec.RandomTestSet(args.LABID, args.PROBID, args.cases)
+            random_set.seed = seed
+            random_set.size = size
+            first = size_idx * args.cases
+            cases = [random_set.case(first + i) for i in range(args.cases)]
+            for exec_p in execs:
+                stats = self.measure(exec_p, cases, config)
+                results[str(exec_p)]["sizes"][size] = stats
+        for exec_p in execs:
+            result = results[str(exec_p)]
+            medians = [result["sizes"][size]["median"] for size in sizes]
+            result["exponent"] = fit_exponent(sizes, medians)
+            print(f"{exec_p}:\n{header}")
+            for size in sizes:
+                stats = result["sizes"][size]
+                line = f"{size:>10}"
+                for key in ("median", "p95", "p99"):
+                    line += f" {stats[key]*1000:>8.2f}ms"
+                if stats["max_rss"]:
+                    line += f" {stats['max_rss']/(1<<20):>8.2f}MB"
+                else:
+                    line += f" {'-':>10}"
+                if stats["failures"]:
+                    line += f" ({stats['failures']} failed)"
+                print(line)
+            if result["exponent"] is not None:
+                print(f"empirical complexity: O(n^{result['exponent']:.2f})")
+        if args.json:
+            Path(args.json).write_text(
+                json.dumps(
+                    {
+                        "lab": args.LABID,
+                        "problem": args.PROBID,
+                        "seed": seed,
+                        "cases": args.cases,
+                        "warmup": args.warmup,
+                        "repeat": args.repeat,
+                        "results": results,
+                    },
+                    indent=2,
+                )
+            )
+
+
+def bench_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="test bench",
+        description="Measure CPU time and peak RSS of executables on random "
+        "testcases of growing sizes and fit the empirical complexity.",
+    )
+    parser.add_argument(
+        "--sizes",
+        default="10,100,1000,10000",
+        help="comma separated sizes of the testcases (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cases", type=int, default=3, help="testcases of every size (default: 3)"
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=1, help="unmeasured runs per case (default: 1)"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="measured runs per case (default: 5)"
+    )
+    parser.add_argument("-s", "--seed", type=int, help="seed of the random testcases")
+    parser.add_argument(
+        "-m",
+        "--match",
+        metavar="SID",
+        action="append",
+        help="also measure the executable of another student",
+    )
+    parser.add_argument("--json", metavar="PATH", help="write the results as JSON")
+    parser.add_argument("LABID", help="usually in the format of lab**")
+    parser.add_argument("PROBID", help="usually a single lowercase letter")
+    parser.add_argument("EXEC", nargs="*", help="the executables to be measured")
+    args = parser.parse_args(argv)
+    if args.cases < 1 or args.repeat < 1:
+        parser.error("--cases and --repeat must be at least 1")
+    if args.warmup < 0:
+        parser.error("--warmup must not be negative")
+    Bench(args).perform()
+
+
+def find_submissions(labID, probID):
+    """Executables `<labID>/<SID>/<probID>` of all SIDs, ordered by SID
+
+    Placeholders of submissions, which are empty or not executable, are left
+    out.
+    """
+    lab_p = Path(__file__).parent / labID
+    found = list()
+    for sid_p in sorted(lab_p.iterdir()):
+        exec_p = sid_p / probID
+        if sid_p.name == "test" or not exec_p.is_file():
+            continue
+        if exec_p.stat().st_size == 0 or not os.access(exec_p, os.X_OK):
+            continue
+        found.append(exec_p)
+    return found
+
+
+def _jobs(jobs, default=1):
+    # number of workers for `-j NUM`, 0 meaning one per core
+    if jobs is None:
+        jobs = default
+    return jobs if jobs > 0 else os.cpu_count() or 1
+
+
+class _Inotify:
+    """Changes of the files in some directories, by inotify(7) through ctypes"""
+
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    MASK = (
+        IN_MODIFY
+        | IN_ATTRIB
+        | IN_CLOSE_WRITE
+        | IN_MOVED_FROM
+        | IN_MOVED_TO
+        | IN_CREATE
+        | IN_DELETE
+    )
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self, dirs):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = dict()
+        for d in dirs:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(d), self.MASK)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"cannot watch {d}")
+            self.dirs[wd] = Path(d)
+
+    def read(self, timeout=None):
+        """Paths changed since the last call, waiting up to `timeout` seconds"""
+        changed = set()
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return changed
+        buf = os.read(self.fd, 1 << 16)
+        pos = 0
+        while pos < len(buf):
+            wd, _, _, size = self._EVENT.unpack_from(buf, pos)
+            pos += self._EVENT.size
+            name = buf[pos : pos + size].rstrip(b"\0")
+            pos += size
+            if wd in self.dirs and name:
+                changed.add(self.dirs[wd] / os.fsdecode(name))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _Polling:
+    """The same as _Inotify by comparing the mtimes of the files"""
+
+    INTERVAL = 0.2
+
+    def __init__(self, dirs):
+        self.dirs = [Path(d) for d in dirs]
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = dict()
+        for d in self.dirs:
+            for p in d.iterdir():
+                try:
+                    st = p.stat()
+                except OSError:
+                    continue
+                snapshot[p] = (st.st_mtime_ns, st.st_size, st.st_mode)
+        return snapshot
+
+    def read(self, timeout=None):
+        time.sleep(self.INTERVAL if timeout is None else min(timeout, self.INTERVAL))
+        snapshot = self._scan()
+        paths = snapshot.keys() | self.snapshot.keys()
+        changed = {p for p in paths if snapshot.get(p) != self.snapshot.get(p)}
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+class Watcher:
+    """Test EXEC again whenever it or the testcases of the problem change
+
+    The process stays alive in between, so that the spec module, the default
+    testcases, which are only read again once modified, and the reference
+    outputs of `-m` are kept in memory. After the first run, only testcases
+    whose verdict may have changed run again, as with `--changed-only`.
+    """
+
+    DEBOUNCE = 0.05  # seconds without changes before testing again
+    IGNORED = ("corpus.dat", "corpus.idx", "__pycache__")
+
+    def __init__(self, args, theme):
+        self.args = args
+        self.theme = theme
+        self.test = Test(args, theme)
+        if args.match and args.cache_size > 0:
+            self.test.ref_cache = RefOutputCache(
+                _CACHE_DIR / "reference", args.cache_size << 20, in_memory=True
+            )
+        self.exec_p = Path(args.EXEC).absolute()
+        self.test_dir = Path(__file__).parent / args.LABID / "test" / args.PROBID
+        dirs = [self.exec_p.parent, self.test_dir]
+        try:
+            self.events = _Inotify(dirs)
+        except (OSError, AttributeError):
+            self.events = _Polling(dirs)
+        DefaultTestSet.cache = dict()
+
+    def relevant(self, p):
+        if p.parent == self.exec_p.parent:
+            return p.name == self.exec_p.name
+        return p.name not in self.IGNORED and not p.name.startswith(".")
+
+    def wait(self):
+        changed = set()
+        while not changed:
+            changed = {p for p in self.events.read() if self.relevant(p)}
+        while True:
+            more = self.events.read(self.DEBOUNCE)
+            if not more:
+                return changed
+            changed |= {p for p in more if self.relevant(p)}
+
+    def run(self):
+        notify = self.theme.notify
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    self.test.perform()
+                except SystemExit:
+                    pass
+                except Exception as e:
+                    notify.error(f"{type(e).__name__}: {e}")
+                elapsed = time.perf_counter() - start
+                print(f"Tested in {elapsed * 1000:.0f}ms, watching for changes")
+                changed = self.wait()
+                names = ", ".join(sorted(p.name for p in changed))
+                print(f"Changed: {names}")
+                for p in changed:
+                    _SPEC_MODULES.pop(p.resolve(), None)
+                self.args.changed_only = True
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.events.close()
+            DefaultTestSet.cache = None
+
+
+def test_all(args, theme):
+    """Test every executable `<LABID>/<SID>/<PROBID>` of every problem having
+    a `<LABID>/test/<PROBID>`, or of PROBID only if given, in one process"""
+    notify = theme.notify
+    lab_p = Path(__file__).parent / args.LABID
+    test_p = lab_p / "test"
+    if not test_p.is_dir():
+        notify.error(f"{test_p} not a directory. Nobody has written a testcase yet")
+        sys.exit(1)
+    if args.PROBID:
+        problems = [args.PROBID]
+    else:
+        problems = sorted(p.name for p in test_p.iterdir() if p.is_dir())
+    sids = sorted(p for p in lab_p.iterdir() if p.is_dir() and p != test_p)
+    summary = list()
+    for prob in problems:
+        for exec_p in find_submissions(args.LABID, prob):
+            sid_p = exec_p.parent
+            print(f"==> {args.LABID} {prob} {sid_p.name}")
+            run_args = argparse.Namespace(**vars(args))
+            run_args.PROBID = prob
+            run_args.EXEC = str(exec_p)
+            try:
+                Test(run_args, theme).perform()
+            except SystemExit:
+                summary.append((prob, sid_p.name, None))
+                continue
+            except Exception as e:
+                # a broken spec must not stop the rest of the lab
+                notify.error(f"{type(e).__name__}: {e}")
+                summary.append((prob, sid_p.name, None))
+                continue
+            summary.append((prob, sid_p.name, theme.testInfo.acc_counts))
+    for sid_p in sids if not args.PROBID else ():
+        for exec_p in sorted(sid_p.iterdir()):
+            if exec_p.name not in problems and exec_p.stat().st_size > 0:
+                notify.warn(f"{exec_p} skipped, no testcase for problem {exec_p.name}")
+    print(f"Summary of {args.LABID}:")
+    for prob, sid, counts in summary:
+        if counts is None:
+            print(f"  {prob} {sid}: aborted")
+            continue
+        success_num = counts[Status.SUCCESS]
+        tot_num = sum(counts.values())
+        print(f"  {prob} {sid}: passed {success_num}/{tot_num}")
+
+
+def _send(f, message, data=None):
+    # a JSON line, followed by the content of the binary file `data` if any
+    f.write(json.dumps(message).encode() + b"\n")
+    if data is not None:
+        shutil.copyfileobj(data, f, 1 << 20)
+    f.flush()
+
+
+def _recv(f):
+    line = f.readline()
+    return json.loads(line) if line else None
+
+
+def _address(txt):
+    """(host, port) of `HOST:PORT`, the host being local if left out"""
+    host, _, port = txt.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+
+class RemotePool:
+    """Work queue handing testcases to workers over TCP
+
+    A worker, `test.py worker HOST:PORT`, connects once per slot and speaks
+    JSON lines: it says {"op": "hello"}, is sent a task {"op": "run", "exec",
+    "input", "verifier", "config"} and answers {"op": "result", "status",
+    "duration", "report"} or {"op": "error", "type", "message"}, until it is
+    told {"op": "bye"}. Executables, inputs, expected outputs and specs are
+    referred to by their sha256. A worker missing one asks {"op": "get",
+    "hash"} and is sent {"op": "blob", "size"} followed by the bytes, which
+    it keeps in `.cache/blobs`, so that every blob is fetched once per
+    machine. Inputs and expected outputs given as strings are only kept here
+    until the tasks referring to them have finished.
+
+    Tasks are handed out in the order they are submitted, and queued again
+    if the worker running one goes away; a worker breaking the protocol
+    fails the task instead. `local` workers are started on this machine as
+    processes of one slot each. Without `listen`, nobody else can connect,
+    so once all of them have exited the tasks left fail rather than wait.
+    Like an executor, it runs `Test.run_case` by `submit`; anything else, and
+    cases whose verifier is not a function of a spec module, run in a thread
+    here.
+    """
+
+    def __init__(self, listen=None, local=0):
+        self.server = socket.create_server(_address(listen or "127.0.0.1:0"))
+        self.address = "%s:%d" % self.server.getsockname()[:2]
+        self.tasks = queue.Queue()  # (task, future, verifier), None at the end
+        self.blobs = dict()  # sha256 -> Path or bytes
+        self.refs = Counter()  # sha256 -> tasks referring to the bytes
+        self.lock = threading.Lock()
+        self.digests = dict()  # (path, mtime, size) -> sha256
+        self.fallback = ThreadPoolExecutor(max_workers=1)
+        self.gone = threading.Event()  # set once no worker can connect anymore
+        threading.Thread(target=self._accept, daemon=True).start()
+        # one slot each, `local` processes of cpu_count slots would oversubscribe
+        test_p = str(Path(__file__).absolute())
+        cmd = [sys.executable, test_p, "worker", "--once", "-j", "1"]
+        if not Cgroup.enabled:
+            cmd.append("--no-cgroup")
+        cmd.append(self.address)
+        self.local = [
+            subprocess.Popen(cmd, stdin=subprocess.DEVNULL) for _ in range(local)
+        ]
+        if self.local and listen is None:
+            threading.Thread(target=self._watch, daemon=True).start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, fn, *args):
+        task = None
+        strings = list()  # digests of the bytes shared for the task
+        if getattr(fn, "__func__", None) is Test.run_case:
+            task = self._task(strings, *args)
+        if task is None:
+            return self.fallback.submit(fn, *args)
+        future = Future()
+        future.add_done_callback(lambda _: self._release(strings))
+        self._put((task, future, args[2]))
+        return future
+
+    def _release(self, strings):
+        with self.lock:
+            for digest in strings:
+                self.refs[digest] -= 1
+                if self.refs[digest] == 0:
+                    del self.refs[digest]
+                    # unless a file with the same content was shared meanwhile
+                    if not isinstance(self.blobs[digest], Path):
+                        del self.blobs[digest]
+
+    def _put(self, item):
+        self.tasks.put(item)
+        if self.gone.is_set():
+            self._fail_pending()
+
+    def _watch(self):
+        for ps in self.local:
+            ps.wait()
+        self.gone.set()
+        self._fail_pending()
+
+    def _fail_pending(self):
+        end = False
+        with contextlib.suppress(queue.Empty):
+            while True:
+                item = self.tasks.get_nowait()
+                if item is None:
+                    end = True
+                else:
+                    item[1].set_exception(RuntimeError("no worker left"))
+        if end:
+            self.tasks.put(None)
+
+    def _share(self, content, strings=None):
+        """sha256 of a Path or a string, which can be fetched from now on
+
+        The digest of a string is added to `strings`, see `_release`.
+        """
+        if isinstance(content, Path):
+            st = content.stat()
+            key = (content, st.st_mtime_ns, st.st_size)
+            digest = self.digests.get(key)
+            if digest is None:
+                digest = self.digests[key] = file_digest(content)
+            with self.lock:
+                self.blobs[digest] = content
+            return digest
+        content = content.encode()
+        digest = hashlib.sha256(content).hexdigest()
+        with self.lock:
+            self.blobs.setdefault(digest, content)
+            self.refs[digest] += 1
+        strings.append(digest)
+        return digest
+
+    def _task(self, strings, exec_p, unit_case, verifier, config):
+        if isinstance(verifier, (str, Path)):
+            spec = {"kind": "expected", "hash": self._share(verifier, strings)}
+        elif isinstance(verifier, ReferenceRun):
+            spec = {
+                "kind": "reference",
+                "hash": self._share(Path(verifier.exec_p)),
+                "timeout": verifier.timeout,
+                "name": verifier.name,
+            }
+        elif isinstance(verifier, NativeChecker):
+            spec = {"kind": "native", "hash": self._share(Path(verifier.spec_p))}
+        else:
+            module = sys.modules.get(getattr(verifier, "__module__", None))
+            name = getattr(verifier, "__name__", None)
+            if module not in _SPEC_MODULES.values() or (
+                getattr(module, name, None) is not verifier  # type: ignore
+            ):
+                return None
+            spec_p = Path(module.__file__)  # type: ignore
+            spec = {"kind": "spec", "hash": self._share(spec_p), "name": name}
+        return {
+            "op": "run",
+            "exec": self._share(Path(exec_p)),
+            "input": self._share(unit_case, strings),
+            "verifier": spec,
+            "config": config,
+        }
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:  # closed
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with conn, conn.makefile("rwb") as f:
+            hello = _recv(f)
+            if hello is None or hello.get("op") != "hello":
+                return
+            while True:
+                item = self.tasks.get()
+                if item is None:
+                    self.tasks.put(None)  # for the other workers
+                    with contextlib.suppress(OSError):
+                        _send(f, {"op": "bye"})
+                    return
+                try:
+                    self._run(f, *item)
+                except (OSError, ValueError):
+                    self._put(item)
+                    return
+                except Exception as e:
+                    item[1].set_exception(
+                        RuntimeError(f"worker broke the protocol: {e!r}")
+                    )
+                    return
+
+    def _run(self, f, task, future, verifier):
+        _send(f, task)
+        while True:
+            message = _recv(f)
+            if message is None:
+                raise ConnectionError("worker went away")
+            if message["op"] != "get":
+                break
+            blob = self.blobs[message["hash"]]
+            if isinstance(blob, Path):
+                with open(blob, "rb") as data:
+                    size = os.fstat(data.fileno()).st_size
+                    _send(f, {"op": "blob", "size": size}, data)
+            else:
+                _send(f, {"op": "blob", "size": len(blob)}, io.BytesIO(blob))
+        if message["op"] == "error":
+            if message["type"] == ReferenceTimeout.__name__:
+                future.set_exception(ReferenceTimeout(message["message"]))
+            else:
+                future.set_exception(
+                    RuntimeError(f"{message['type']} on worker: {message['message']}")
+                )
+            return
+        report = message["report"]
+        if "mismatch" in report:
+            report["mismatch"] = tuple(report["mismatch"])
+        if isinstance(verifier, ReferenceRun):
+            verifier.output = message["reference"]
+            if verifier.cache is not None and message["reference_code"] == 0:
+                verifier.cache.put(verifier.key, verifier.output)
+        future.set_result((Status(message["status"]), message["duration"], report))
+
+    def close(self):
+        # tasks left after an error are dropped, the workers are sent away
+        with contextlib.suppress(queue.Empty):
+            while True:
+                self.tasks.get_nowait()
+        self.tasks.put(None)
+        for ps in self.local:
+            try:
+                ps.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                ps.kill()
+                ps.wait()
+        self.server.close()
+        self.fallback.shutdown()
+
+
+def _fetch(f, digest, suffix="", executable=False):
+    """Path of the blob `digest` in `.cache/blobs`, asked for if missing"""
+    path = _CACHE_DIR / "blobs" / (digest + suffix)
+    if path.exists():
+        return path
+    _send(f, {"op": "get", "hash": digest})
+    size = _recv(f)["size"]  # type: ignore
+    path.parent.mkdir(parents=True, exist_ok=True)
+    h = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as tmp:
+        try:
+            while size > 0:
+                chunk = f.read(min(size, 1 << 20))
+                if not chunk:
+                    raise ConnectionError("test went away")
+                h.update(chunk)
+                tmp.write(chunk)
+                size -= len(chunk)
+            if h.hexdigest() != digest:
+                raise ValueError(f"blob {digest} corrupted")
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+    if executable:
+        os.chmod(tmp.name, 0o755)
+    os.replace(tmp.name, path)
+    return path
+
+
+def _run_task(test, f, task):
+    # the answer of a worker to the task `task`, see `RemotePool`
+    v = task["verifier"]
+    if v["kind"] == "expected":
+        verifier = _fetch(f, v["hash"])
+    elif v["kind"] == "reference":
+        exec_p = _fetch(f, v["hash"], executable=True)
+        verifier = ReferenceRun(exec_p, v["hash"], v["timeout"], v["name"])
+    elif v["kind"] == "native":
+        verifier = NativeChecker(_fetch(f, v["hash"], executable=True))
+    else:
+        verifier = _fetch(f, v["hash"], ".py")
+    exec_p = _fetch(f, task["exec"], executable=True)
+    unit_case = _fetch(f, task["input"])
+    try:
+        if v["kind"] == "spec":
+            verifier = getattr(load_spec(verifier), v["name"])
+        status, duration, report = test.run_case(
+            exec_p, unit_case, verifier, task["config"]
+        )
+    except Exception as e:
+        return {"op": "error", "type": type(e).__name__, "message": str(e)}
+    result = {
+        "op": "result",
+        "status": status.value,
+        "duration": duration,
+        "report": report,
+    }
+    if isinstance(verifier, ReferenceRun):
+        result.update(reference=verifier.output, reference_code=verifier.returncode)
+    return result
+
+
+def _work(address, once):
+    # a slot of a worker, connecting to the test at `address` again and again
+    test = Test(argparse.Namespace(LABID=None, PROBID=None))
+    while True:
+        try:
+            with socket.create_connection(address) as conn:
+                with conn.makefile("rwb") as f:
+                    _send(f, {"op": "hello"})
+                    while True:
+                        task = _recv(f)
+                        if task is None or task["op"] == "bye":
+                            break
+                        _send(f, _run_task(test, f, task))
+        except (OSError, ValueError):
+            pass
+        if once:
+            return
+        time.sleep(1)
+
+
+def worker_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="test worker",
+        description="Run the testcases of `test --listen HOST:PORT` on this "
+        "machine, see `RemotePool` in test.py for the protocol. Executables sent "
+        "by the test are run as they are, so only connect to a test you trust.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=0,
+        help="run NUM testcases in parallel, 0 (the default) meaning one per core",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="exit once the test is over instead of waiting for the next one",
+    )
+    parser.add_argument(
+        "--no-cgroup",
+        action="store_true",
+        help="do not run every testcase in a cgroup of its own",
+    )
+    parser.add_argument("ADDRESS", help="HOST:PORT the test listens on")
+    args = parser.parse_args(argv)
+    Cgroup.enabled = not args.no_cgroup
+    address = _address(args.ADDRESS)
+    slots = [
+        threading.Thread(target=_work, args=(address, args.once), daemon=True)
+        for _ in range(_jobs(args.jobs))
+    ]
+    for slot in slots:
+        slot.start()
+    try:
+        for slot in slots:
+            slot.join()
+    except KeyboardInterrupt:
+        pass
 
 
 def main(args):
     _THEME = DefaultTheme()
+    _THEME.testInfo = make_reporter(args, _THEME)
+    Cgroup.enabled = not args.no_cgroup
+    if args.watch:
+        Watcher(args, _THEME).run()
+        return
+    if args.all:
+        test_all(args, _THEME)
+        return
     Test(args, theme=_THEME).perform()
     # print(args)
 
 
 if __name__ == "__main__":
+    # specs import this file as `test`, which must not be executed again
+    sys.modules.setdefault("test", sys.modules["__main__"])
+    if sys.argv[1:2] == ["bench"]:
+        bench_main(sys.argv[2:])
+        sys.exit(0)
+    if sys.argv[1:2] == ["worker"]:
+        worker_main(sys.argv[2:])
+        sys.exit(0)
     parser = argparse.ArgumentParser(
-        usage="test [-h] [-rR NUM] [-l] [-m SID] LABID PROBID EXEC",
+        usage="test [-h] [-rR NUM] [-l] [-m SID] [-j NUM] [-s SEED] [-g NUM] LABID PROBID EXEC\n"
+        "       test --all [-rR NUM] [-m SID] [-j NUM] [-s SEED] LABID [PROBID]\n"
+        "       test --grade [-rR NUM] [-m SID] [-j NUM] [-s SEED] LABID PROBID",
         prog="test",
         description="A simple tool for test cpp codes.",
         epilog=epilog,
@@ -485,8 +3927,138 @@ if __name__ == "__main__":
     parser.add_argument(
         "-l", "--list-available", action="store_true", help="list available executables"
     )
+    parser.add_argument("-j", "--jobs", type=int, help="run NUM testcases in parallel")
+    parser.add_argument("-s", "--seed", type=int, help="seed of the random testcases")
+    parser.add_argument(
+        "--case",
+        type=int,
+        metavar="NUM",
+        help="only test the NUM-th random testcase, to be used with -s and -r",
+    )
+    parser.add_argument(
+        "-g",
+        "--gen-workers",
+        type=int,
+        default=0,
+        metavar="NUM",
+        help="generate random testcases in NUM worker processes",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=64,
+        metavar="NUM",
+        help="generate at most NUM random testcases ahead of execution",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=256,
+        metavar="MB",
+        help="size of the reference output cache, 0 to disable it",
+    )
+    parser.add_argument(
+        "--changed-only",
+        action="store_true",
+        help="skip testcases whose verdict with the same EXEC is known",
+    )
+    parser.add_argument(
+        "--failed-first",
+        action="store_true",
+        help="test the testcases which failed last time first",
+    )
+    parser.add_argument(
+        "--stress",
+        action="store_true",
+        help="match on random cases until a counterexample is found and shrunk",
+    )
+    parser.add_argument(
+        "--save-cases",
+        action="store_true",
+        help="store the random testcases in the corpus of the problem",
+    )
+    parser.add_argument(
+        "--save-failing",
+        action="store_true",
+        help="store the failed random testcases in the corpus of the problem",
+    )
+    parser.add_argument(
+        "--replay",
+        choices=("all", "generated", "failing"),
+        help="test the testcases stored in the corpus, or those with a tag",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="time the phases of every testcase",
+    )
+    parser.add_argument(
+        "--profile-spec",
+        action="store_true",
+        help="also profile the spec code by cProfile, implies --profile",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="write the timings of the phases to PATH as a Chrome trace",
+    )
+    parser.add_argument(
+        "--report",
+        choices=("verbose", "progress"),
+        default="verbose",
+        help="print every testcase, or a progress bar and the failures only",
+    )
+    parser.add_argument(
+        "--jsonl", metavar="PATH", help="write the verdicts as JSON lines to PATH"
+    )
+    parser.add_argument(
+        "--junit", metavar="PATH", help="write the verdicts as JUnit XML to PATH"
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="test again whenever EXEC or the testcases change",
+    )
+    parser.add_argument(
+        "--no-cgroup",
+        action="store_true",
+        help="do not run every testcase in a cgroup of its own",
+    )
+    parser.add_argument(
+        "--schedule",
+        choices=("longest", "order"),
+        default="longest",
+        help="start the testcases expected to take longest first, or in order",
+    )
+    parser.add_argument(
+        "--listen",
+        metavar="HOST:PORT",
+        help="run the testcases on the workers connecting to HOST:PORT",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        metavar="NUM",
+        help="run the testcases on NUM local worker processes over TCP",
+    )
+    parser.add_argument(
+        "--grade",
+        action="store_true",
+        help="grade every submission of PROBID on the same testcases",
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="test every executable of every problem, or of PROBID, in the lab",
+    )
     parser.add_argument("LABID", help="usually in the format of lab**")
-    parser.add_argument("PROBID", help="usually a single lowercase letter")
-    parser.add_argument("EXEC", help="the executable to be tests")
-
-    main(parser.parse_args())
+    parser.add_argument("PROBID", nargs="?", help="usually a single lowercase letter")
+    parser.add_argument("EXEC", nargs="?", help="the executable to be tests")
+
+    args = parser.parse_args()
+    if args.PROBID is None and not args.all:
+        parser.error("PROBID is required without --all")
+    if args.EXEC is None and not (args.all or args.grade):
+        parser.error("EXEC is required without --all or --grade")
+    main(args)